@@ -1,9 +1,14 @@
 #!/usr/bin/env python
 
+import fnmatch # Used to select probed gates by name
+import gc     # Used to pause garbage collection while parsing
+import hashlib # Used to identify circuits in checkpoints
 import json   # Used when TRACE=jsonp
 import os     # Used to get the TRACE environment variable
 import re     # Used when TRACE=jsonp
+import struct # Used to read and write checkpoints
 import sys    # Used to smooth over the range / xrange issue.
+import time   # Used to measure parsing throughput.
 
 # Python 3 doesn't have xrange, and range behaves like xrange.
 if sys.version_info >= (3,):
@@ -12,9 +17,96 @@ if sys.version_info >= (3,):
 
 # Circuit simulation library.
 
+# Logic values. X is an unknown value, and Z is the output of a gate that does
+# not drive its output (high impedance). Gate inputs read Z as X.
+X = 2
+Z = 3
+# The names of the logic values in the simulator's input and output.
+VALUE_NAMES = ['0', '1', 'x', 'z']
+# All the logic values.
+VALUES = (0, 1, X, Z)
+_VALUE_TOKENS = {'0': 0, '1': 1, 'x': X, 'X': X, 'z': Z, 'Z': Z}
+
+
+def parse_value(token):
+    """The logic value named by a token in the simulator's input.
+    
+    Args:
+        token: '0', '1', 'x' or 'z'. Letters can be in either case.
+    
+    Raises:
+        ValueError: An exception if the token does not name a logic value.
+    """
+    if token not in _VALUE_TOKENS:
+        raise ValueError('Invalid logic value ' + token)
+    return _VALUE_TOKENS[token]
+
+
+# Bit-parallel evaluators for the common gate functions, of any number of
+# inputs. Each one computes the output word for a list of input words, as
+# described in TruthTable.word_output.
+
+def _and_word(input_words, mask):
+    word = mask
+    for input_word in input_words:
+        word &= input_word
+    return word
+
+
+def _nand_word(input_words, mask):
+    return mask & ~_and_word(input_words, mask)
+
+
+def _or_word(input_words, mask):
+    word = 0
+    for input_word in input_words:
+        word |= input_word
+    return word & mask
+
+
+def _nor_word(input_words, mask):
+    return mask & ~_or_word(input_words, mask)
+
+
+def _xor_word(input_words, mask):
+    word = 0
+    for input_word in input_words:
+        word ^= input_word
+    return word & mask
+
+
+def _xnor_word(input_words, mask):
+    return mask & ~_xor_word(input_words, mask)
+
+
+def _buf_word(input_words, mask):
+    return input_words[0] & mask
+
+
+def _not_word(input_words, mask):
+    return mask & ~input_words[0]
+
+
 class TruthTable:
-    """Truth table representation of the logic inside a gate."""
+    """Truth table representation of the logic inside a gate.
     
+    The table lists the outputs for binary inputs. Its entries can be X or Z,
+    e.g. for tri-state buffers. When some inputs are X or Z, the output is the
+    one that all the binary values of those inputs agree on, or X if they
+    disagree. These outputs are compiled into a lookup table indexed by the
+    inputs, for tables with up to COMPILED_INPUT_LIMIT inputs.
+    """
+    
+    # The largest number of inputs of a table with a compiled lookup table.
+    # The lookup table has 4 ** input_count entries.
+    COMPILED_INPUT_LIMIT = 8
+
+    # The gate functions that tables are recognized as, and their evaluators
+    # for bit-parallel input words.
+    FUNCTIONS = {'and': _and_word, 'nand': _nand_word, 'or': _or_word,
+                 'nor': _nor_word, 'xor': _xor_word, 'xnor': _xnor_word,
+                 'buf': _buf_word, 'not': _not_word}
+
     def __init__(self, name, output_list):
         """Creates a truth table from a list representation.
         
@@ -29,15 +121,113 @@ class TruthTable:
         self.name = name
         self.table = self._build_table(output_list)
         self.input_count = self._table_depth(self.table)
+        # The outputs, indexed by the inputs read as a binary number whose most
+        # significant bit is the first input.
+        self.flat_table = list(output_list)
+        # True if all the outputs are 0 or 1.
+        self.binary = all([value == 0 or value == 1 for value in output_list])
+        # The outputs for all input values, indexed by the inputs read as a
+        # base-4 number whose most significant digit is the first input.
+        self.compiled_table = None
+        if self.input_count <= TruthTable.COMPILED_INPUT_LIMIT:
+            self.compiled_table = self._compile_table(self.flat_table)
+        # The name of the gate function that the table computes, as listed in
+        # TruthTable.FUNCTIONS, or None for other tables.
+        self.function = self._function_name(self.flat_table)
+
+        # evaluate(inputs) and evaluate_words(input_words, mask) are the
+        # unchecked versions of output and word_output, for simulators that
+        # already know that the inputs have the right size.
+        if self.compiled_table is not None:
+            self.evaluate = self._compiled_output
+        else:
+            self.evaluate = self._walked_output
+        if self.function is not None:
+            self.evaluate_words = TruthTable.FUNCTIONS[self.function]
+        else:
+            self.evaluate_words = self._table_word_output
 
     def output(self, inputs):
         """Computes the output for this truth table, given a list of inputs."""
         if len(inputs) != self.input_count:
             raise ValueError('Inputs list is incorrectly sized')
-        value = self.table
-        for i in inputs:
-            value = value[i]
-        return value
+        return self.evaluate(inputs)
+
+    def word_output(self, input_words, mask):
+        """Computes the outputs for many input vectors at once.
+        
+        Args:
+            input_words: A list of integers, one per input. Bit k of each word
+                holds the input's value in the k-th input vector.
+            mask: An integer whose set bits are the vectors being evaluated.
+        
+        Returns:
+            An integer whose bit k holds the output for the k-th input vector.
+        """
+        if len(input_words) != self.input_count:
+            raise ValueError('Inputs list is incorrectly sized')
+        if not self.binary:
+            raise ValueError('Truth table ' + self.name + ' is not binary')
+        return self.evaluate_words(input_words, mask)
+
+    def _function_name(self, outputs):
+        # The name of the gate function whose truth table is outputs, or None.
+        if not self.binary:
+            return None
+        if len(outputs) == 2:
+            return {(0, 1): 'buf', (1, 0): 'not'}.get(tuple(outputs))
+        last = len(outputs) - 1
+        parity = [bin(i).count('1') & 1 for i in xrange(len(outputs))]
+        for name, table in [('and', [0] * last + [1]),
+                            ('nand', [1] * last + [0]),
+                            ('or', [0] + [1] * last),
+                            ('nor', [1] + [0] * last),
+                            ('xor', parity),
+                            ('xnor', [1 - bit for bit in parity])]:
+            if outputs == table:
+                return name
+        return None
+
+    def _compiled_output(self, inputs):
+        # Evaluates the table with its compiled lookup table.
+        index = 0
+        for value in inputs:
+            index = (index << 2) | value
+        return self.compiled_table[index]
+
+    def _walked_output(self, inputs):
+        # Evaluates the table by walking it, for tables that are not compiled.
+        return self._output(self.table, inputs, 0)
+
+    def _table_word_output(self, input_words, mask):
+        # Evaluates the table for bit-parallel input words.
+        return self._word_output(self.table, input_words, 0, mask)
+
+    def _output(self, table, inputs, depth):
+        # Evaluates a (sub-)table by walking it, for any input values.
+        if depth == len(inputs):
+            return table
+        value = inputs[depth]
+        if value == 0 or value == 1:
+            return self._output(table[value], inputs, depth + 1)
+        low = self._output(table[0], inputs, depth + 1)
+        high = self._output(table[1], inputs, depth + 1)
+        return low if low == high else X
+
+    def _compile_table(self, outputs):
+        # The lookup table for all input values, given the binary outputs.
+        #
+        # The first input's value picks a quarter of the table: the table for
+        # the other inputs in the first or second half of the outputs, or for
+        # X and Z, the merge of those two tables.
+        if len(outputs) == 1:
+            return list(outputs)
+        half = len(outputs) // 2
+        low = self._compile_table(outputs[0:half])
+        high = self._compile_table(outputs[half:])
+        unknown = [low[i] if low[i] == high[i] else X
+                   for i in xrange(len(low))]
+        return low + high + unknown + unknown
 
     def _build_table(self, output_list):
         # Builds an evaluation table out of a list of truth table values.
@@ -46,7 +236,7 @@ class TruthTable:
         #    TypeError: An exception if the list's length is not a power of two.
         if len(output_list) == 2:
             for value in output_list:
-                if value != 0 and value != 1:
+                if value != 0 and value != 1 and value != X and value != Z:
                     raise TypeError('Invalid value in truth output list')
             return output_list
         else:
@@ -57,18 +247,118 @@ class TruthTable:
             return [self._build_table(output_list[0:half]),
                     self._build_table(output_list[half:])]
 
+    def _word_output(self, table, input_words, depth, mask):
+        # Evaluates a (sub-)table using bitwise operations.
+        #
+        # Each level of the table is a multiplexer driven by one input: the
+        # vectors whose input bit is 0 take the first half of the table, and
+        # the others take the second half.
+        if table == 0:
+            return 0
+        if table == 1:
+            return mask
+        low = self._word_output(table[0], input_words, depth + 1, mask)
+        high = self._word_output(table[1], input_words, depth + 1, mask)
+        if low == high:
+            return low
+        word = input_words[depth]
+        return (low & ~word) | (high & word)
+
     def _table_depth(self, table):
         # The depth (number of inputs) of a truth table.
         depth = 0
-        while table != 0 and table != 1:
+        while isinstance(table, list):
             depth += 1
             table = table[0]
         return depth
 
 
+# Evaluators for the common gate functions, of any number of inputs. Each one
+# computes a gate's output from the outputs of the gates connected to its
+# inputs, and handles X and Z inputs the same way as a compiled lookup table.
+
+def _and_gates(in_gates):
+    output = 1
+    for gate in in_gates:
+        value = gate.output
+        if value == 0:
+            return 0
+        if value != 1:
+            output = X
+    return output
+
+
+def _nand_gates(in_gates):
+    output = 0
+    for gate in in_gates:
+        value = gate.output
+        if value == 0:
+            return 1
+        if value != 1:
+            output = X
+    return output
+
+
+def _or_gates(in_gates):
+    output = 0
+    for gate in in_gates:
+        value = gate.output
+        if value == 1:
+            return 1
+        if value != 0:
+            output = X
+    return output
+
+
+def _nor_gates(in_gates):
+    output = 1
+    for gate in in_gates:
+        value = gate.output
+        if value == 1:
+            return 0
+        if value != 0:
+            output = X
+    return output
+
+
+def _xor_gates(in_gates):
+    output = 0
+    for gate in in_gates:
+        value = gate.output
+        if value > 1:
+            return X
+        output ^= value
+    return output
+
+
+def _xnor_gates(in_gates):
+    output = 1
+    for gate in in_gates:
+        value = gate.output
+        if value > 1:
+            return X
+        output ^= value
+    return output
+
+
+def _buf_gates(in_gates):
+    value = in_gates[0].output
+    return value if value < 2 else X
+
+
+def _not_gates(in_gates):
+    value = in_gates[0].output
+    return 1 - value if value < 2 else X
+
+
 class GateType:
     """A type of gate, e.g. 2-input NAND with 60ps delay."""
     
+    # The evaluators for the gate functions listed in TruthTable.FUNCTIONS.
+    EVALUATORS = {'and': _and_gates, 'nand': _nand_gates, 'or': _or_gates,
+                  'nor': _nor_gates, 'xor': _xor_gates, 'xnor': _xnor_gates,
+                  'buf': _buf_gates, 'not': _not_gates}
+    
     def __init__(self, name, truth_table, delay):
         """Creates a gate type with a truth table and output delay.
         
@@ -87,11 +377,26 @@ class GateType:
         self.truth_table = truth_table
         self.input_count = truth_table.input_count
         self.delay = delay
+        # Computes a gate's output from the list of gates connected to its
+        # inputs. Common gate functions have specialized evaluators, and other
+        # truth tables are evaluated on the list of the gates' outputs.
+        if truth_table.function is not None:
+            self.evaluate = GateType.EVALUATORS[truth_table.function]
+        else:
+            self.evaluate = self._table_output
 
     def output(self, inputs):
         """The gate's output value, given a list of inputs."""
         return self.truth_table.output(inputs)
+
+    def word_output(self, input_words, mask):
+        """The gate's output word, given a list of bit-parallel input words."""
+        return self.truth_table.word_output(input_words, mask)
     
+    def _table_output(self, in_gates):
+        # Evaluates the truth table on the outputs of a list of gates.
+        return self.truth_table.evaluate([gate.output for gate in in_gates])
+
     def output_time(self, input_time):
         """The time of the gate's output transition.
         
@@ -116,10 +421,15 @@ class Gate:
         """
         self.name = name
         self.gate_type = gate_type
-        self.in_gates = [None for i in xrange(gate_type.input_count)]
+        self.in_gates = [None] * gate_type.input_count
         self.out_gates = []
         self.probed = False
         self.output = 0
+        # The value and time of the transition that will be applied last, out
+        # of the gate's pending transitions. The simulator uses them to skip
+        # transitions that would not change the gate's output.
+        self.scheduled_output = 0
+        self.scheduled_time = float('-inf')
   
     def connect_input(self, gate, terminal):
         """Connects one of this gate's input terminals to another gate's output.
@@ -156,7 +466,7 @@ class Gate:
   
     def has_output_connected(self):
         """True if the gate's output terminal is connected to another gate."""
-        return self.out_gates.length > 0
+        return len(self.out_gates) > 0
   
     def is_connected(self):
         """True if all the gate's inputs and outputs are connected."""
@@ -169,7 +479,7 @@ class Gate:
         a delay from its inputs' transitions to the output's transition. The 
         circuit simulator is responsible for setting the appropriate time. 
         """
-        return self.gate_type.output([gate.output for gate in self.in_gates])
+        return self.gate_type.evaluate(self.in_gates)
   
     def transition_time(self, input_time):
         """The time that the gate's output will reflect a change in its inputs.
@@ -199,6 +509,11 @@ class Circuit:
         self.truth_tables = {}
         self.gate_types = {}
         self.gates = {}
+        # The CircuitAnalysis returned by analysis. Computed when needed, and
+        # discarded when a gate is added or connected.
+        self.cached_analysis = None
+        # The gates' output when the circuit is powered up, set by reset.
+        self.initial_output = 0
 
     def add_truth_table(self, name, output_list):
         """Adds a truth table that can be later attached to gate types.
@@ -245,27 +560,240 @@ class Circuit:
         Returns:
             The newly created Gate instance.
         """
-        if name in self.gates:
+        gates = self.gates
+        if name in gates:
             raise ValueError('Gate name already used')
         gate_type = self.gate_types[type_name]
-        self.gates[name] = new_gate = Gate(name, gate_type)
+        gates[name] = new_gate = Gate(name, gate_type)
+        self.cached_analysis = None
+        # Inlined connect_input; the new gate's terminals are all unconnected.
+        in_gates = new_gate.in_gates
         for i in xrange(len(input_names)):
-            gate = self.gates[input_names[i]]
-            new_gate.connect_input(gate, i)
+            gate = gates[input_names[i]]
+            in_gates[i] = gate
+            gate.out_gates.append(new_gate)
         return new_gate
     
+    def connect(self, gate_name, input_name, terminal):
+        """Connects one of a gate's input terminals to another gate's output.
+
+        Unlike Gate.connect_input, this discards the circuit's cached
+        analysis, so a gate added with some of its inputs unconnected can be
+        wired up later.
+
+        Args:
+            gate_name: The name of the gate whose input terminal will be
+                connected.
+            input_name: The name of the gate whose output terminal will be
+                connected.
+            terminal: The number of the input terminal that will be connected
+                (using 0-based indexing)
+        """
+        gates = self.gates
+        gates[gate_name].connect_input(gates[input_name], terminal)
+        self.cached_analysis = None
+
     def add_probe(self, gate_name):
         """Adds a gate to the list of outputs."""
         gate = self.gates[gate_name]
         gate.probe()
+
+    def reset(self, output=None):
+        """Sets all the gates' outputs back to their initial value.
+        
+        This allows running another simulation on the same circuit.
+        
+        Args:
+            output: The gates' initial output, such as X to simulate a circuit
+                whose state is unknown when it is powered up. It becomes the
+                circuit's initial_output, used by later resets. Defaults to
+                initial_output, which starts out as 0.
+        """
+        if output is None:
+            output = self.initial_output
+        self.initial_output = output
+        for gate in self.gates.values():
+            gate.output = output
+            gate.scheduled_output = output
+            gate.scheduled_time = float('-inf')
+
+    def topological_order(self):
+        """The circuit's gates, ordered so that each gate comes after the gates
+        connected to its inputs.
+        
+        Raises:
+            ValueError: An exception if the circuit's gates form a cycle.
+        """
+        in_counts = {}
+        ready = []
+        for gate in self.gates.values():
+            count = 0
+            for in_gate in gate.in_gates:
+                if in_gate is not None:
+                    count += 1
+            in_counts[gate.name] = count
+            if count == 0:
+                ready.append(gate)
+        
+        order = []
+        while len(ready) > 0:
+            gate = ready.pop()
+            order.append(gate)
+            for out_gate in gate.out_gates:
+                in_counts[out_gate.name] -= 1
+                if in_counts[out_gate.name] == 0:
+                    ready.append(out_gate)
+        if len(order) != len(self.gates):
+            raise ValueError('Circuit has a cycle')
+        return order
       
+    def analysis(self):
+        """The circuit's levels, critical path and cones, as a CircuitAnalysis.
+
+        The analysis is computed on the first call, and reused until a gate
+        is added with add_gate or connected with connect.
+
+        Raises:
+            ValueError: An exception if the circuit's gates form a cycle.
+        """
+        if self.cached_analysis is None:
+            self.cached_analysis = CircuitAnalysis(self)
+        return self.cached_analysis
+
     def as_json(self):
         """A hash that obeys the JSON format, representing the circuit."""
         json = {}
-        json['gates'] = [gate.as_json() for gate in self.gates.itervalues()]
+        json['gates'] = [gate.as_json() for gate in self.gates.values()]
         return json
 
 
+class CircuitAnalysis:
+    """Structural and timing properties of a circuit.
+
+    The properties of all the gates are computed in one pass over the
+    circuit's gates in topological order, which takes time proportional to
+    the number of connections. Fan-in and fan-out cones are computed for one
+    gate at a time, when they are first requested.
+    """
+
+    def __init__(self, circuit):
+        """Analyzes a completely built circuit.
+
+        Args:
+            circuit: The circuit to be analyzed.
+
+        Raises:
+            ValueError: An exception if the circuit's gates form a cycle.
+        """
+        self.circuit = circuit
+        # The gates, ordered so that each gate comes after the gates connected
+        # to its inputs.
+        self.order = circuit.topological_order()
+        # Each gate's level, by gate name. Gates whose inputs are not all
+        # connected, such as input gates, are on level 0. Other gates are one
+        # level above the highest gate connected to their inputs.
+        self.levels = {}
+        # Each gate's arrival time, by gate name: the longest time that a
+        # transition of a level 0 gate's inputs takes to reach the gate's
+        # output, adding up gate delays.
+        self.arrival_times = {}
+        # The gate connected to each gate's inputs with the latest arrival
+        # time, by gate name, or None for gates on level 0.
+        self.critical_inputs = {}
+        levels = self.levels
+        arrival_times = self.arrival_times
+        for gate in self.order:
+            level = 0
+            arrival_time = 0
+            critical_input = None
+            if gate.has_inputs_connected():
+                for in_gate in gate.in_gates:
+                    level = max(level, levels[in_gate.name] + 1)
+                    if (critical_input is None or
+                            arrival_times[in_gate.name] > arrival_time):
+                        arrival_time = arrival_times[in_gate.name]
+                        critical_input = in_gate
+            levels[gate.name] = level
+            arrival_times[gate.name] = arrival_time + gate.gate_type.delay
+            self.critical_inputs[gate.name] = critical_input
+        # The highest level of a gate in the circuit.
+        self.depth = max([0] + list(levels.values()))
+        # The latest arrival time of a gate in the circuit.
+        self.critical_path_delay = max([0] + list(arrival_times.values()))
+        # The cones returned by fan_in_cone and fan_out_cone, by gate name.
+        self.fan_in_cones = {}
+        self.fan_out_cones = {}
+
+    def critical_path(self, gate_name=None):
+        """The names of the gates on the slowest path to a gate.
+
+        Args:
+            gate_name: The gate at the end of the path. Defaults to a gate
+                whose arrival time is critical_path_delay.
+
+        Returns:
+            A list of gate names, starting with a level 0 gate and ending with
+            the given gate.
+        """
+        if gate_name is None:
+            if len(self.order) == 0:
+                return []
+            gate_name = max([(self.arrival_times[gate.name], gate.name)
+                             for gate in self.order])[1]
+        path = []
+        gate = self.circuit.gates[gate_name]
+        while gate is not None:
+            path.append(gate.name)
+            gate = self.critical_inputs[gate.name]
+        path.reverse()
+        return path
+
+    def fan_in_cone(self, gate_name):
+        """The names of the gates whose outputs can affect a gate's output.
+
+        Returns:
+            A frozenset with the gate's name and the names of all the gates
+            connected to its inputs, directly or through other gates.
+        """
+        if gate_name not in self.fan_in_cones:
+            self.fan_in_cones[gate_name] = self._cone(gate_name, 'in_gates')
+        return self.fan_in_cones[gate_name]
+
+    def fan_out_cone(self, gate_name):
+        """The names of the gates whose outputs can be affected by a gate.
+
+        Returns:
+            A frozenset with the gate's name and the names of all the gates
+            connected to its output, directly or through other gates.
+        """
+        if gate_name not in self.fan_out_cones:
+            self.fan_out_cones[gate_name] = self._cone(gate_name, 'out_gates')
+        return self.fan_out_cones[gate_name]
+
+    def _cone(self, gate_name, neighbors):
+        # The names of the gates reachable from a gate by following one of the
+        # gates' neighbor lists (in_gates or out_gates).
+        cone = set([gate_name])
+        pending = [self.circuit.gates[gate_name]]
+        while len(pending) > 0:
+            for neighbor in getattr(pending.pop(), neighbors):
+                if neighbor is not None and neighbor.name not in cone:
+                    cone.add(neighbor.name)
+                    pending.append(neighbor)
+        return frozenset(cone)
+
+    def as_json(self):
+        """A hash that obeys the JSON format, summarizing the analysis."""
+        return {'gates': len(self.order), 'depth': self.depth,
+                'critical_path_delay': self.critical_path_delay,
+                'critical_path': self.critical_path()}
+
+    def to_file(self, file):
+        """Writes the summary returned by as_json to a file, in JSON format."""
+        json.dump(self.as_json(), file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
 class Transition:
     """A transition in a gate's output."""
   
@@ -278,9 +806,10 @@ class Transition:
             time: The time at which the Gate's output will match the new value.
         
         Raises:
-            ValueError: An exception if the output is not 0 or 1. 
+            ValueError: An exception if the output is not 0, 1, X or Z.
         """
-        if new_output != 0 and new_output != 1:
+        if (new_output != 0 and new_output != 1 and new_output != X and
+                new_output != Z):
             raise ValueError('Invalid output value')
         self.gate = gate
         self.new_output = new_output
@@ -383,6 +912,10 @@ class PriorityQueue:
         self.min_index = None
         return popped_key
 
+    def items(self):
+        """The elements in the queue, in no particular order."""
+        return list(self.queue)
+
     def _find_min(self):
         # Computes the index of the minimum element in the queue.
         #
@@ -430,6 +963,10 @@ class HeapPriorityQueue:
             return None
         return self.heap[0]
 
+    def items(self):
+        """The elements in the queue, in no particular order."""
+        return list(self.heap)
+
     def pop(self):
         """Removes the minimum element in the queue.
 
@@ -516,6 +1053,482 @@ class HeapPriorityQueue:
         return 'heap: {}, length: {}'.format(self.heap, len(self))
 
 
+class ProbeWriter:
+    """Streams a simulation's probe results to a file as they are produced.
+
+    The simulation steps through time in increasing order, but the transitions
+    that happen at the same time are not recorded in any particular order, and
+    zero-delay gates can spread them over several steps. So the writer buffers
+    the results for the current time, and sorts and writes them once the
+    simulation moves past that time. The output matches
+    Simulation.outputs_to_file, without holding the whole trace in memory.
+    """
+
+    def __init__(self, file):
+        """Creates a writer that has not received any results.
+
+        Args:
+            file: A File object that receives the probe results.
+        """
+        self.file = file
+        self.pending = []
+        self.pending_time = None
+        self.count = 0
+
+    def append(self, probe):
+        """Records a probe result, given as a [time, gate name, output] list."""
+        if probe[0] != self.pending_time:
+            self.flush()
+            self.pending_time = probe[0]
+        self.pending.append(probe)
+
+    def flush(self):
+        """Writes the buffered probe results to the file."""
+        self.pending.sort()
+        write = self.file.write
+        for probe in self.pending:
+            write(' '.join([str(probe[0]), probe[1], VALUE_NAMES[probe[2]]]))
+            write("\n")
+        self.count += len(self.pending)
+        self.pending = []
+
+
+class ProbeFilter:
+    """Chooses which transitions of the probed gates a simulation records.
+
+    A filter only records the transitions in a time window, and can sample
+    them, by only recording every Nth transition of each gate. The time
+    window is checked once per simulation step, so the transitions outside
+    it cost nothing to filter.
+    """
+
+    def __init__(self, start_time=None, end_time=None, every=1):
+        """Creates a filter.
+
+        Args:
+            start_time: The beginning of the time window, or None for no
+                beginning.
+            end_time: The end of the time window (included), or None for no
+                end.
+            every: Record one transition out of this many for each gate.
+        """
+        if every < 1:
+            raise ValueError('Invalid sampling interval')
+        self.start_time = start_time
+        self.end_time = end_time
+        self.every = every
+        # Maps each gate to the number of its transitions seen in the window.
+        self.counts = {}
+
+    def covers(self, time):
+        """True if the transitions at a time are in the filter's window."""
+        return ((self.start_time is None or time >= self.start_time) and
+                (self.end_time is None or time <= self.end_time))
+
+    def sample(self, gate):
+        """True if the next transition of a gate in the window is recorded."""
+        count = self.counts.get(gate, 0)
+        self.counts[gate] = count + 1
+        return count % self.every == 0
+
+
+class JsonpTraceWriter:
+    """Streams a simulation's trace to a JSONP file for the visualizer.
+
+    The circuit and layout are written when the writer is created, and the
+    trace is written in chunks while the simulation runs, so the memory used
+    does not grow with the size of the circuit or the length of the trace.
+
+    The trace is written in a columnar encoding. Each chunk has a list of
+    time differences from the previous transition ("dt"), a list of gate
+    numbers, which are positions in the circuit's "gates" list ("gate"), and
+    a list of output values ("value"). Transitions that happen at the same
+    time are sorted by gate name, like in ProbeWriter.
+    """
+
+    # Number of transitions in a chunk.
+    CHUNK_SIZE = 4096
+
+    def __init__(self, file, circuit, layout_svg):
+        """Writes the trace's header.
+
+        Args:
+            file: A File object that receives the trace.
+            circuit: The simulated circuit. The header records which gates
+                are probed, so it should be created before probe_all_gates.
+            layout_svg: The circuit's layout, from layout_from_file.
+        """
+        self.file = file
+        self.gate_numbers = {}
+        file.write('onJsonp({"circuit": {"gates": [')
+        separator = ''
+        for gate in circuit.gates.values():
+            self.gate_numbers[gate.name] = len(self.gate_numbers)
+            file.write(separator)
+            file.write(json.dumps(gate.as_json()))
+            separator = ', '
+        file.write(']}, "layout": ')
+        file.write(json.dumps(layout_svg))
+        file.write(', "trace": {"format": "columnar", "chunks": [')
+        self.pending = []
+        self.pending_time = None
+        self.chunk = []
+        self.chunks = 0
+        self.last_time = 0
+        self.count = 0
+
+    def append(self, probe):
+        """Records a probe result, given as a [time, gate name, output] list."""
+        if probe[0] != self.pending_time:
+            self._sort_pending()
+            self.pending_time = probe[0]
+        self.pending.append(probe)
+
+    def flush(self):
+        """Writes the buffered trace to the file."""
+        self._sort_pending()
+        if len(self.chunk) > 0:
+            self._write_chunk()
+
+    def close(self):
+        """Writes the buffered trace and ends the JSONP file."""
+        self.flush()
+        self.file.write(']}});\n')
+
+    def _sort_pending(self):
+        # Moves the results for the current time to the chunk, in order.
+        self.pending.sort()
+        self.chunk.extend(self.pending)
+        self.count += len(self.pending)
+        self.pending = []
+        if len(self.chunk) >= JsonpTraceWriter.CHUNK_SIZE:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        # Writes the transitions in the chunk, and empties it.
+        deltas = []
+        last_time = self.last_time
+        for probe in self.chunk:
+            deltas.append(probe[0] - last_time)
+            last_time = probe[0]
+        self.last_time = last_time
+        gate_numbers = self.gate_numbers
+        if self.chunks > 0:
+            self.file.write(', ')
+        self.file.write(json.dumps(
+            {'dt': deltas,
+             'gate': [gate_numbers[probe[1]] for probe in self.chunk],
+             'value': [probe[2] for probe in self.chunk]},
+            separators=(',', ':'), sort_keys=True))
+        self.chunks += 1
+        self.chunk = []
+
+
+class LineReader:
+    """Reads a file's lines in large blocks.
+    
+    Reading a large block and splitting it into lines is much faster than 
+    calling readline() for every line.
+    """
+
+    # Number of characters read from the file at a time.
+    BLOCK_SIZE = 1 << 20
+
+    def __init__(self, file):
+        """Creates a reader positioned at the file's current position.
+
+        Args:
+            file: A File object supplying the input.
+        """
+        self.file = file
+        self.partial_line = ''
+        self.bytes_read = 0
+        self.at_eof = False
+
+    def read_lines(self):
+        """The next batch of lines, without line terminators.
+        
+        Returns:
+            A list of lines, or None if the whole file was read.
+        """
+        if self.at_eof:
+            return None
+        block = self.file.read(LineReader.BLOCK_SIZE)
+        self.bytes_read += len(block)
+        if len(block) == 0:
+            self.at_eof = True
+            lines = [self.partial_line]
+            self.partial_line = ''
+            return lines
+        lines = (self.partial_line + block).split('\n')
+        self.partial_line = lines.pop()
+        return lines
+
+
+class SimulationStats:
+    """Counters describing the work done by a simulation.
+    
+    Collecting the counters costs a few operations per simulation step, and
+    nothing per transition. A simulation only collects them after its 
+    enable_stats method is called.
+    """
+
+    def __init__(self):
+        """Creates a set of counters that are all 0."""
+        # Transitions added to the queue.
+        self.events_scheduled = 0
+        # Transitions that were superseded, and never added to the queue.
+        self.events_dropped = 0
+        # Transitions popped from the queue that changed a gate's output.
+        self.events_applied = 0
+        # Transitions popped from the queue that did not change anything.
+        self.events_discarded = 0
+        # The largest number of transitions in the queue at once.
+        self.queue_high_water = 0
+        # Number of simulation steps (time slices).
+        self.steps = 0
+        # Maps a number of transitions applied in a step to the number of
+        # steps that applied that many transitions.
+        self.slice_sizes = {}
+        # Number of times a gate's output was computed from its inputs.
+        self.gate_evaluations = 0
+        # Wall-clock seconds spent in each phase: parse, run, output. Probe
+        # results streamed by a ProbeWriter are counted in run.
+        self.phase_seconds = {}
+        # The parse_stats of the simulation, if it was read from a file.
+        self.parse = None
+
+    def record_step(self, popped, applied, evaluated, queued, queue_length):
+        """Updates the counters with the work done in a simulation step.
+        
+        Args:
+            popped: Number of transitions removed from the queue.
+            applied: Number of transitions that changed a gate's output.
+            evaluated: Number of gates whose outputs were computed.
+            queued: Number of transitions added to the queue.
+            queue_length: The queue's length at the end of the step.
+        """
+        self.steps += 1
+        self.events_applied += applied
+        self.events_discarded += popped - applied
+        self.gate_evaluations += evaluated
+        self.events_scheduled += queued
+        self.events_dropped += evaluated - queued
+        self.slice_sizes[applied] = self.slice_sizes.get(applied, 0) + 1
+        if queue_length > self.queue_high_water:
+            self.queue_high_water = queue_length
+
+    def as_json(self):
+        """A hash that obeys the JSON format, representing the counters."""
+        return {'events_scheduled': self.events_scheduled,
+                'events_dropped': self.events_dropped,
+                'events_applied': self.events_applied,
+                'events_discarded': self.events_discarded,
+                'queue_high_water': self.queue_high_water,
+                'steps': self.steps,
+                'max_slice_size': max([0] + list(self.slice_sizes.keys())),
+                'slice_sizes': dict([(str(size), count) for size, count
+                                     in self.slice_sizes.items()]),
+                'gate_evaluations': self.gate_evaluations,
+                'phase_seconds': self.phase_seconds,
+                'parse': self.parse}
+
+    def to_file(self, file):
+        """Writes the counters to a file, in JSON format."""
+        json.dump(self.as_json(), file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+class BinaryWriter:
+    """Writes arrays of little-endian numbers to a binary file."""
+
+    def __init__(self, file):
+        """Creates a writer for a File object opened in binary mode."""
+        self.file = file
+
+    def raw(self, data):
+        """Writes a bytes object as is."""
+        self.file.write(data)
+
+    def ints(self, values):
+        """Writes a list of 32-bit signed integers."""
+        self.file.write(struct.pack('<%di' % len(values), *values))
+
+    def longs(self, values):
+        """Writes a list of 64-bit signed integers."""
+        self.file.write(struct.pack('<%dq' % len(values), *values))
+
+    def bytes(self, values):
+        """Writes a list of integers between 0 and 255."""
+        self.file.write(struct.pack('<%dB' % len(values), *values))
+
+    def strings(self, values):
+        """Writes a list of strings.
+
+        Only the last string may contain newlines, because the strings are
+        joined with newlines and written as a single length-prefixed block.
+        """
+        data = '\n'.join(values)
+        if sys.version_info >= (3,):
+            data = data.encode('utf-8')
+        self.ints([len(values), len(data)])
+        self.file.write(data)
+
+
+class BinaryReader:
+    """Reads arrays of little-endian numbers written by a BinaryWriter."""
+
+    def __init__(self, buffer):
+        """Creates a reader for a bytes object or a memory-mapped file."""
+        self.buffer = buffer
+        self.offset = 0
+
+    def raw(self, length):
+        """Reads a bytes object of a given length."""
+        data = self.buffer[self.offset:self.offset + length]
+        self.offset += length
+        return data
+
+    def ints(self, count):
+        """Reads a tuple of 32-bit signed integers."""
+        return self._unpack('<%di' % count, 4 * count)
+
+    def longs(self, count):
+        """Reads a tuple of 64-bit signed integers."""
+        return self._unpack('<%dq' % count, 8 * count)
+
+    def bytes(self, count):
+        """Reads a tuple of integers between 0 and 255."""
+        return self._unpack('<%dB' % count, count)
+
+    def strings(self):
+        """Reads a list of strings written by BinaryWriter.strings."""
+        count, length = self.ints(2)
+        text = self.raw(length)
+        if sys.version_info >= (3,):
+            text = text.decode('utf-8')
+        if count == 0:
+            return []
+        if count == 1:
+            return [text]
+        return text.split('\n', count - 1)
+
+    def _unpack(self, format, length):
+        # Unpacks values at the current offset, and moves past them.
+        values = struct.unpack_from(format, self.buffer, self.offset)
+        self.offset += length
+        return values
+
+
+class Checkpoint:
+    """A snapshot of a running simulation, used to resume it later.
+
+    A checkpoint holds the gates' outputs, the pending transitions (in the
+    order they would be popped), the simulation time, the probe results
+    collected so far and the probe filter's sampling counters. Gates are identified by their positions in the sorted
+    list of gate names, so a checkpoint can be restored into any simulation
+    of the same circuit, such as one built by a later process.
+
+    Probe results streamed to a ProbeWriter are not part of a checkpoint.
+    """
+
+    MAGIC = b'CKPT'
+    VERSION = 2
+    # Stands for a time that is not set (float('-inf') or None) in files.
+    NO_TIME = -(1 << 63)
+
+    def __init__(self, fingerprint, time, outputs, scheduled_outputs,
+                 scheduled_times, transitions, probes, probe_counts=None):
+        """Creates a checkpoint out of a simulation's state.
+
+        Checkpoints are normally created by Simulation.checkpoint or
+        Checkpoint.from_file.
+
+        Args:
+            fingerprint: Identifies the circuit, see Simulation.fingerprint.
+            time: The time of the simulation's last step, or None.
+            outputs: The gates' outputs, in gate number order.
+            scheduled_outputs: The gates' scheduled_output values.
+            scheduled_times: The gates' scheduled_time values.
+            transitions: The pending transitions, as [time, gate number,
+                output] lists in the order they would be popped.
+            probes: The probe results, as [time, gate number, output] lists.
+            probe_counts: The number of each gate's transitions seen by the
+                simulation's ProbeFilter, in gate number order. Defaults to
+                all 0s.
+        """
+        self.fingerprint = fingerprint
+        self.time = time
+        self.outputs = outputs
+        self.scheduled_outputs = scheduled_outputs
+        self.scheduled_times = scheduled_times
+        self.transitions = transitions
+        self.probes = probes
+        if probe_counts is None:
+            probe_counts = [0] * len(outputs)
+        self.probe_counts = probe_counts
+
+    def to_file(self, file):
+        """Writes the checkpoint to a file opened in binary mode."""
+        no_time = Checkpoint.NO_TIME
+        writer = BinaryWriter(file)
+        writer.raw(Checkpoint.MAGIC)
+        writer.ints([Checkpoint.VERSION, len(self.outputs),
+                     len(self.transitions), len(self.probes)])
+        writer.raw(self.fingerprint)
+        writer.longs([no_time if self.time is None else self.time])
+        writer.bytes(self.outputs)
+        writer.bytes(self.scheduled_outputs)
+        writer.longs([no_time if scheduled_time == float('-inf')
+                      else scheduled_time
+                      for scheduled_time in self.scheduled_times])
+        for events in [self.transitions, self.probes]:
+            writer.longs([event[0] for event in events])
+            writer.ints([event[1] for event in events])
+            writer.bytes([event[2] for event in events])
+        writer.longs(self.probe_counts)
+
+    @staticmethod
+    def from_file(file):
+        """Reads a checkpoint written by Checkpoint.to_file.
+
+        Args:
+            file: A File object opened in binary mode.
+
+        Raises:
+            ValueError: An exception if the file is not a checkpoint, or was
+                produced by a different version of this code.
+        """
+        reader = BinaryReader(file.read())
+        try:
+            if (reader.raw(len(Checkpoint.MAGIC)) != Checkpoint.MAGIC or
+                    reader.ints(1)[0] != Checkpoint.VERSION):
+                raise ValueError('Not a checkpoint file for this version')
+            gate_count, transition_count, probe_count = reader.ints(3)
+            fingerprint = reader.raw(32)
+            time = reader.longs(1)[0]
+            outputs = list(reader.bytes(gate_count))
+            scheduled_outputs = list(reader.bytes(gate_count))
+            scheduled_times = [
+                float('-inf') if scheduled_time == Checkpoint.NO_TIME
+                else scheduled_time
+                for scheduled_time in reader.longs(gate_count)]
+            events = []
+            for count in [transition_count, probe_count]:
+                times = reader.longs(count)
+                gate_numbers = reader.ints(count)
+                values = reader.bytes(count)
+                events.append([[times[i], gate_numbers[i], values[i]]
+                               for i in xrange(count)])
+            probe_counts = list(reader.longs(gate_count))
+        except struct.error:
+            raise ValueError('Truncated checkpoint file')
+        if time == Checkpoint.NO_TIME:
+            time = None
+        return Checkpoint(fingerprint, time, outputs, scheduled_outputs,
+                          scheduled_times, events[0], events[1], probe_counts)
+
+
 class Simulation:
     """State needed to compute a circuit's state as it evolves over time."""
     
@@ -531,11 +1544,30 @@ class Simulation:
         """
         self.circuit = circuit
         self.in_transitions = []
+        self.unread_input = ''
+        self.parse_stats = None
         
         self.queue = HeapPriorityQueue()
         # self.queue = PriorityQueue()
         self.probes = []
+        self.probe_writer = None
+        self.probe_filter = None
         self.probe_all_undo_log = []
+        self.stats = None
+        self.started = False
+        # The simulation time: the time of the last step, or the end of the
+        # last run_until window if that is later. None before the first step.
+        self.time = None
+        self.checkpoint_path = None
+        self.checkpoint_steps = None
+        # Steps taken since the last checkpoint was written. Kept across
+        # run_until windows, which can be shorter than checkpoint_steps.
+        self.steps_since_checkpoint = 0
+        # The gates sorted by name, their positions in that list, and the
+        # circuit's fingerprint, used by checkpoints. Computed when needed.
+        self.numbered_gates = None
+        self.gate_numbers = None
+        self.circuit_fingerprint = None
 
     def add_transition(self, gate_name, output_value, output_time):
         """Adds a transition to the simulation's initial conditions.
@@ -544,6 +1576,46 @@ class Simulation:
         """
         gate = self.circuit.gates[gate_name]
         self.in_transitions.append([output_time, gate_name, output_value, gate])
+
+    def stream_probes_to(self, file):
+        """Writes probe results to a file while the simulation runs.
+        
+        The results are not collected in self.probes, so the memory used does
+        not grow with the length of the trace.
+        
+        Args:
+            file: A File object that receives the probe results.
+        """
+        self.probe_writer = ProbeWriter(file)
+
+    def stream_jsonp_to(self, file):
+        """Writes the trace to a JSONP file for the visualizer while running.
+        
+        The circuit's layout must be read by layout_from_file first. The
+        simulation's probe results are not collected in self.probes, and the
+        file must be finished with close_jsonp once the simulation ends.
+        
+        Args:
+            file: A File object that receives the trace.
+        """
+        self.probe_writer = JsonpTraceWriter(file, self.circuit,
+                                             self.layout_svg)
+
+    def close_jsonp(self):
+        """Finishes the JSONP file started by stream_jsonp_to."""
+        self.probe_writer.close()
+
+    def enable_stats(self):
+        """Starts collecting performance counters in self.stats.
+        
+        Returns:
+            The SimulationStats instance receiving the counters.
+        """
+        self.stats = SimulationStats()
+        if self.parse_stats is not None:
+            self.stats.parse = self.parse_stats
+            self.stats.phase_seconds['parse'] = self.parse_stats['seconds']
+        return self.stats
     
     def step(self):
         """Runs the simulation for one time slice.
@@ -556,6 +1628,18 @@ class Simulation:
             The simulation time after the step occurred.
         """ 
         step_time = self.queue.min().time
+        self.time = step_time
+        queue_length = len(self.queue)
+        if self.probe_writer is None:
+          probes = self.probes
+        else:
+          probes = self.probe_writer
+        probe_filter = self.probe_filter
+        if probe_filter is not None:
+          if not probe_filter.covers(step_time):
+            probes = None
+          elif probe_filter.every == 1:
+            probe_filter = None
         
         # Need to apply all the transitions at the same time before propagating.
         transitions = []
@@ -564,36 +1648,309 @@ class Simulation:
           if not transition.is_valid():
             continue
           transition.apply()
-          if transition.gate.probed:
-            self.probes.append([transition.time, transition.gate.name,
-                                transition.new_output])
+          if transition.gate.probed and probes is not None:
+            if probe_filter is None or probe_filter.sample(transition.gate):
+              probes.append([transition.time, transition.gate.name,
+                             transition.new_output])
           transitions.append(transition)
+        remaining = len(self.queue)
         
-        # Propagate the transition effects.
+        # Propagate the transition effects. A gate connected to several of the
+        # changed outputs is evaluated once, after all the changes.
+        affected_gates = []
+        seen_gates = set()
         for transition in transitions:
           for gate in transition.gate.out_gates:
-            output = gate.transition_output()
-            time = gate.transition_time(step_time)
-            self.queue.append(Transition(gate, output, time))
+            if gate not in seen_gates:
+              seen_gates.add(gate)
+              affected_gates.append(gate)
+        for gate in affected_gates:
+          output = gate.transition_output()
+          time = gate.transition_time(step_time)
+          self._schedule(gate, output, time)
         
+        if self.stats is not None:
+          # The counts come from the queue's length, to keep the loops lean.
+          self.stats.record_step(queue_length - remaining, len(transitions),
+                                 len(affected_gates),
+                                 len(self.queue) - remaining, len(self.queue))
         return step_time
+
+    def _schedule(self, gate, output, time):
+        # Queues a transition of a gate's output, unless it is superseded.
+        #
+        # A gate's transitions are applied in (time, creation) order, and
+        # invalid transitions are skipped, so once all of a gate's pending
+        # transitions are processed, its output matches the value of the last
+        # one. A new transition that comes after all the pending transitions
+        # and has that same value would be invalid when popped, so it is
+        # dropped here instead of going through the queue.
+        #
+        # Returns:
+        #     True if the transition was queued, False if it was dropped.
+        if time >= gate.scheduled_time:
+            if output == gate.scheduled_output:
+                return False
+            gate.scheduled_output = output
+            gate.scheduled_time = time
+        self.queue.append(Transition(gate, output, time))
+        return True
     
+    def start(self):
+        """Queues the initial transitions, before the first step.
+        
+        run calls this if needed. A simulation restored from a checkpoint is
+        already started, and does not queue its initial transitions again.
+        """
+        for in_transition in sorted(self.in_transitions):
+            self._schedule(in_transition[3], in_transition[2],
+                           in_transition[0])
+        if self.stats is not None:
+            self.stats.events_scheduled += len(self.queue)
+            self.stats.events_dropped += len(self.in_transitions) - len(
+                self.queue)
+            self.stats.queue_high_water = max(self.stats.queue_high_water,
+                                              len(self.queue))
+        self.started = True
+
     def run(self):
         """Runs the simulation to completion."""
-        for in_transition in sorted(self.in_transitions):
-            self.queue.append(Transition(in_transition[3], in_transition[2],
-                                         in_transition[0]))
-        while len(self.queue) > 0:
+        self._run_steps(None)
+
+    def run_until(self, end_time):
+        """Runs the simulation until all the transitions up to a time happen.
+        
+        The simulation can be continued by calling run_until or run_for with a
+        later time, or run, and input transitions can be added in between
+        with inject_transition. Probe results up to end_time are available
+        when the method returns.
+        
+        Args:
+            end_time: The time of the last transitions that will happen.
+        """
+        self._run_steps(end_time)
+        if self.time is None or end_time > self.time:
+            self.time = end_time
+
+    def run_for(self, duration):
+        """Runs the simulation for some time after the current time.
+        
+        A simulation that did not take any steps starts at time 0.
+        """
+        self.run_until((0 if self.time is None else self.time) + duration)
+
+    def inject_transition(self, gate_name, output_value, output_time):
+        """Adds an input transition to a simulation that may be running.
+        
+        Before the simulation starts, this is the same as add_transition.
+        
+        Raises:
+            ValueError: An exception if the transition would happen at or
+                before the current simulation time.
+        """
+        if not self.started:
+            self.add_transition(gate_name, output_value, output_time)
+            return
+        if self.time is not None and output_time <= self.time:
+            raise ValueError('Cannot add a transition at or before the '
+                             'simulation time')
+        queued = self._schedule(self.circuit.gates[gate_name], output_value,
+                                output_time)
+        if self.stats is not None:
+            if queued:
+                self.stats.events_scheduled += 1
+            else:
+                self.stats.events_dropped += 1
+
+    def _run_steps(self, end_time):
+        # Runs simulation steps until the queue is empty, or the next
+        # transition happens after end_time (if end_time is not None).
+        start_time = time.time()
+        if not self.started:
+            self.start()
+        while len(self.queue) > 0 and (end_time is None or
+                                       self.queue.min().time <= end_time):
             self.step()
-        self.probes.sort()
+            if self.checkpoint_path is not None:
+                self.steps_since_checkpoint += 1
+                if self.steps_since_checkpoint >= self.checkpoint_steps:
+                    self._write_checkpoint()
+                    self.steps_since_checkpoint = 0
+        if self.probe_writer is None:
+            self.probes.sort()
+        else:
+            self.probe_writer.flush()
+        if self.stats is not None:
+            self.stats.phase_seconds['run'] = (
+                self.stats.phase_seconds.get('run', 0) +
+                time.time() - start_time)
+
+    def checkpoint_to(self, path, steps):
+        """Writes a checkpoint to a file periodically while the simulation runs.
+        
+        Each checkpoint is written to a temporary file that replaces the
+        previous checkpoint, so the file always holds a complete checkpoint.
+        
+        Args:
+            path: The path of the checkpoint file.
+            steps: The number of simulation steps between checkpoints.
+        """
+        if steps < 1:
+            raise ValueError('Invalid number of steps between checkpoints')
+        self.checkpoint_path = path
+        self.checkpoint_steps = steps
+        self.steps_since_checkpoint = 0
+
+    def _write_checkpoint(self):
+        # Replaces the checkpoint file with the simulation's current state.
+        temp_path = self.checkpoint_path + '.' + str(os.getpid())
+        with open(temp_path, 'wb') as checkpoint_file:
+            self.checkpoint().to_file(checkpoint_file)
+        # os.rename does not replace existing files on Windows.
+        getattr(os, 'replace', os.rename)(temp_path, self.checkpoint_path)
+
+    def checkpoint(self, with_probes=True):
+        """A Checkpoint holding the simulation's current state.
+        
+        The circuit must be completely built.
+        
+        Args:
+            with_probes: False to leave the probe results out of the
+                checkpoint, when the caller keeps track of them.
+        """
+        self._number_gates()
+        gate_numbers = self.gate_numbers
+        gates = self.numbered_gates
+        probe_counts = None
+        if self.probe_filter is not None:
+            counts = self.probe_filter.counts
+            probe_counts = [counts.get(gate, 0) for gate in gates]
+        return Checkpoint(
+            self.fingerprint(), self.time, [gate.output for gate in gates],
+            [gate.scheduled_output for gate in gates],
+            [gate.scheduled_time for gate in gates],
+            [[transition.time, gate_numbers[transition.gate.name],
+              transition.new_output]
+             for transition in sorted(self.queue.items())],
+            [[probe[0], gate_numbers[probe[1]], probe[2]]
+             for probe in self.probes] if with_probes else [], probe_counts)
+
+    def restore(self, checkpoint):
+        """Puts the simulation in the state saved by a checkpoint.
+        
+        The simulation's queue and probe results are replaced, and it is
+        marked as started, so run continues from the checkpoint. Sampled
+        traces continue where they left off if filter_probes is called with
+        the same arguments before restore.
+        
+        Args:
+            checkpoint: A Checkpoint taken from a simulation of the same
+                circuit.
+        
+        Raises:
+            ValueError: An exception if the checkpoint was taken from a
+                simulation of a different circuit.
+        """
+        if checkpoint.fingerprint != self.fingerprint():
+            raise ValueError('Checkpoint is for a different circuit')
+        gates = self.numbered_gates
+        for i in xrange(len(gates)):
+            gate = gates[i]
+            gate.output = checkpoint.outputs[i]
+            gate.scheduled_output = checkpoint.scheduled_outputs[i]
+            gate.scheduled_time = checkpoint.scheduled_times[i]
+        # Transitions are created in pop order, so their object IDs preserve
+        # the order of transitions that happen at the same time.
+        self.queue = self.queue.__class__()
+        for transition_time, gate_number, output in checkpoint.transitions:
+            self.queue.append(Transition(gates[gate_number], output,
+                                         transition_time))
+        self.probes = [[probe[0], gates[probe[1]].name, probe[2]]
+                       for probe in checkpoint.probes]
+        if self.probe_filter is not None:
+            self.probe_filter.counts = dict(
+                [(gates[i], checkpoint.probe_counts[i])
+                 for i in xrange(len(gates)) if checkpoint.probe_counts[i]])
+        self.time = checkpoint.time
+        self.started = True
+
+    def fingerprint(self):
+        """A 32-byte digest identifying the circuit's gates.
+        
+        The digest covers the gates' names, types and connections, so
+        checkpoints are not restored into a different circuit.
+        """
+        if self.circuit_fingerprint is not None:
+            return self.circuit_fingerprint
+        self._number_gates()
+        lines = []
+        for gate in self.numbered_gates:
+            lines.append(' '.join([gate.name, gate.gate_type.name] + [
+                '-' if in_gate is None else in_gate.name
+                for in_gate in gate.in_gates]))
+        data = '\n'.join(lines)
+        if sys.version_info >= (3,):
+            data = data.encode('utf-8')
+        self.circuit_fingerprint = hashlib.sha256(data).digest()
+        return self.circuit_fingerprint
+
+    def _number_gates(self):
+        # Computes numbered_gates and gate_numbers, if needed.
+        if self.numbered_gates is not None:
+            return
+        self.numbered_gates = [self.circuit.gates[name]
+                               for name in sorted(self.circuit.gates.keys())]
+        self.gate_numbers = dict([(self.numbered_gates[i].name, i)
+                                  for i in xrange(len(self.numbered_gates))])
             
     def probe_all_gates(self):
         """Turns on probing for all gates in the simulation."""
-        for gate in self.circuit.gates.itervalues():
+        for gate in self.circuit.gates.values():
             if not gate.probed:
                 self.probe_all_undo_log.append(gate)
                 gate.probe()
 
+    def probe_matching(self, pattern):
+        """Turns on probing for the gates whose names match a pattern.
+        
+        undo_probe_all_gates reverts the effects of this method too.
+        
+        Args:
+            pattern: A glob pattern such as 'adder*' (case-sensitive), or a
+                compiled regular expression that is searched for in the
+                names, such as re.compile('^mul_[0-9]+$').
+        
+        Returns:
+            The number of gates that matched the pattern.
+        """
+        if hasattr(pattern, 'search'):
+            matches = pattern.search
+        else:
+            matches = lambda name: fnmatch.fnmatchcase(name, pattern)
+        count = 0
+        for gate in self.circuit.gates.values():
+            if matches(gate.name):
+                count += 1
+                if not gate.probed:
+                    self.probe_all_undo_log.append(gate)
+                    gate.probe()
+        return count
+
+    def filter_probes(self, start_time=None, end_time=None, every=1):
+        """Limits the probed transitions that the simulation records.
+        
+        Args:
+            start_time: Transitions before this time are not recorded.
+            end_time: Transitions after this time are not recorded.
+            every: Only record every Nth transition of each probed gate,
+                starting with the first one in the time window.
+        
+        Returns:
+            The ProbeFilter used by the simulation.
+        """
+        self.probe_filter = ProbeFilter(start_time, end_time, every)
+        return self.probe_filter
+
     def undo_probe_all_gates(self):
         """Reverts the effects of calling probe_all_gates!"""  
         for gate in self.probe_all_undo_log:
@@ -604,42 +1961,82 @@ class Simulation:
     def from_file(file):
         """Builds a simulation by reading a textual description from a file.
         
+        The file is read in large blocks. The text following the done command
+        is kept in the simulation's unread_input, for layout_from_file. The
+        simulation's parse_stats reports the parser's throughput.
+        
         Args:
             file: A File object supplying the input.
         
         Returns: A new Simulation instance.
+        
+        Raises:
+            ValueError: An exception if the input ends before a done command.
         """
-        circuit = Circuit()
-        simulation = Simulation(circuit)
+        simulation = Simulation(Circuit())
+        start_time = time.time()
+        reader = LineReader(file)
         
+        # The parser creates many objects that reference each other, which 
+        # makes the garbage collector repeatedly scan the growing circuit.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            line_count = simulation._read_commands(reader)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        
+        seconds = time.time() - start_time
+        parsed_bytes = reader.bytes_read - len(simulation.unread_input)
+        simulation.parse_stats = {
+            'lines': line_count, 'bytes': parsed_bytes, 'seconds': seconds,
+            'bytes_per_second': parsed_bytes / seconds if seconds > 0 else None}
+        return simulation
+    
+    def _read_commands(self, reader):
+        # Executes the commands supplied by a LineReader, up to done.
+        #
+        # Returns:
+        #     The number of lines read, including the done command.
+        circuit = self.circuit
+        line_count = 0
         while True:
-            command = file.readline().split()
-            if len(command) < 1:
-                continue
-            if command[0] == 'table':
-                outputs = [int(token) for token in command[2:]]
-                circuit.add_truth_table(command[1], outputs)
-            elif command[0] == 'type':
-                if len(command) != 4:
-                    raise ValueError('Invalid number of arguments for gate type'
-                                     ' command')
-                circuit.add_gate_type(command[1], command[2], int(command[3]))
-            elif command[0] == 'gate':
-                circuit.add_gate(command[1], command[2], command[3:])
-            elif command[0] == 'probe':
-                if len(command) != 2:
-                    raise ValueError('Invalid number of arguments for gate '
-                                      'probe command')
-                circuit.add_probe(command[1])
-            elif command[0] == 'flip':
-                if len(command) != 4:
-                    raise ValueError('Invalid number of arguments for flip '
-                                     'command')
-                simulation.add_transition(command[1], int(command[2]), 
+            lines = reader.read_lines()
+            if lines is None:
+                raise ValueError('Input lacks the done command')
+            for i in xrange(len(lines)):
+                command = lines[i].split()
+                if len(command) < 1:
+                    continue
+                if command[0] == 'gate':
+                    circuit.add_gate(command[1], command[2], command[3:])
+                elif command[0] == 'table':
+                    outputs = [parse_value(token) for token in command[2:]]
+                    circuit.add_truth_table(command[1], outputs)
+                elif command[0] == 'type':
+                    if len(command) != 4:
+                        raise ValueError('Invalid number of arguments for gate '
+                                         'type command')
+                    circuit.add_gate_type(command[1], command[2],
                                           int(command[3]))
-            elif command[0] == 'done':
-                break
-        return simulation
+                elif command[0] == 'probe':
+                    if len(command) != 2:
+                        raise ValueError('Invalid number of arguments for gate '
+                                          'probe command')
+                    circuit.add_probe(command[1])
+                elif command[0] == 'flip':
+                    if len(command) != 4:
+                        raise ValueError('Invalid number of arguments for flip '
+                                         'command')
+                    self.add_transition(command[1], parse_value(command[2]),
+                                        int(command[3]))
+                elif command[0] == 'done':
+                    # Keep the text after "done" for layout_from_file.
+                    self.unread_input = '\n'.join(
+                        lines[i + 1:] + [reader.partial_line])
+                    return line_count + i + 1
+            line_count += len(lines)
     
     def layout_from_file(self, file):
         """Reads the simulation's visual layout from a file.
@@ -650,18 +2047,18 @@ class Simulation:
         Returns:
              self.
         """
-        while True:
-          line = file.readline()
-          if len(line) == 0:
-              raise ValueError('Input lacks circuit layout information')
-          if line.strip() == 'layout':
-              svg = file.read()
-              # Get rid of the XML doctype.
-              svg = re.sub('\\<\\?xml.*\\?\\>', '', svg)
-              svg = re.sub('\\<\\!DOCTYPE[^>]*\\>', '', svg)
-              self.layout_svg = svg.strip()
-              break
-        self
+        # The beginning of the layout might have been read by from_file.
+        text = self.unread_input + file.read()
+        self.unread_input = ''
+        match = re.search('^[ \\t\\r]*layout[ \\t\\r]*$', text, re.MULTILINE)
+        if match is None:
+            raise ValueError('Input lacks circuit layout information')
+        svg = text[match.end():]
+        # Get rid of the XML doctype.
+        svg = re.sub('\\<\\?xml.*\\?\\>', '', svg)
+        svg = re.sub('\\<\\!DOCTYPE[^>]*\\>', '', svg)
+        self.layout_svg = svg.strip()
+        return self
     
     def trace_as_json(self):
         """A hash that obeys the JSON format, containing simulation data."""
@@ -669,7 +2066,8 @@ class Simulation:
                 'layout': self.layout_svg}
     
     def outputs_to_line_list(self):
-        return [' '.join([str(probe[0]), probe[1], str(probe[2])]) for probe in self.probes]
+        return [' '.join([str(probe[0]), probe[1], VALUE_NAMES[probe[2]]])
+                for probe in self.probes]
     
     def outputs_to_file(self, file):
         """Writes a textual description of the simulation's probe results to a 
@@ -678,9 +2076,12 @@ class Simulation:
         Args:
             file: A File object that receives the probe results.
         """
+        start_time = time.time()
         for line in self.outputs_to_line_list():
             file.write(line)
             file.write("\n")
+        if self.stats is not None:
+            self.stats.phase_seconds['output'] = time.time() - start_time
             
     def jsonp_to_file(self, file):
         """Writes a JSONP description of the simulation's probe results to a 
@@ -689,24 +2090,495 @@ class Simulation:
         Args:
             file: A File object that receives the probe results.
         """
+        start_time = time.time()
         file.write('onJsonp(')
         json.dump(self.trace_as_json(), file)
         file.write(');\n')
+        if self.stats is not None:
+            self.stats.phase_seconds['output'] = time.time() - start_time
+
+
+class IncrementalSimulation:
+    """Re-simulates a circuit after edits to its stimulus.
+
+    Each run keeps in-memory checkpoints of the simulation's state, taken
+    every few steps. When the stimulus changes, the next run starts from the
+    last checkpoint taken before the earliest changed transition, and reuses
+    the probe results recorded up to that checkpoint.
+
+    Checkpoints are only taken once all the transitions at a time have been
+    processed, so the probe results they cover are exactly the ones that
+    happen at or before their time.
+
+    Every run starts with the gates' outputs at the circuit's initial_output,
+    so a circuit reset to X is simulated from an unknown state each time.
+    """
+
+    def __init__(self, circuit, checkpoint_steps=1000):
+        """Creates an incremental simulation of a completely built circuit.
+
+        Args:
+            circuit: The circuit whose state transitions will be simulated.
+            checkpoint_steps: The number of simulation steps between
+                checkpoints. Each checkpoint holds a copy of all the gates'
+                states, so fewer steps use more memory.
+        """
+        self.circuit = circuit
+        self.checkpoint_steps = checkpoint_steps
+        # The stimulus of the last run, as sorted (time, gate name, output)
+        # tuples, its checkpoints in time order, and its probe results.
+        # Checkpoints taken by earlier runs are kept if they come before the
+        # stimulus changes, so each checkpoint is stored in a (checkpoint,
+        # stimulus) pair with the stimulus of the run that took it.
+        self.in_transitions = None
+        self.checkpoints = []
+        self.probes = []
+        # The time of the checkpoint that the last run started from, or None
+        # if it simulated everything, and the number of steps it ran.
+        self.resumed_time = None
+        self.steps = 0
+
+    def run(self, in_transitions):
+        """Simulates the circuit's response to a stimulus.
+
+        Args:
+            in_transitions: A list of [time, input gate name, output] lists,
+                like Simulation.in_transitions.
+
+        Returns:
+            The probe results, sorted like Simulation.probes.
+        """
+        new_transitions = sorted([tuple(in_transition[0:3])
+                                  for in_transition in in_transitions])
+        if new_transitions == self.in_transitions:
+            self.resumed_time = None
+            self.steps = 0
+            return self.probes
+        checkpoint = None
+        if self.in_transitions is not None:
+            change_time = self._change_time(self.in_transitions,
+                                            new_transitions)
+            while (len(self.checkpoints) > 0 and
+                   self.checkpoints[-1][0].time >= change_time):
+                self.checkpoints.pop()
+            if len(self.checkpoints) > 0:
+                checkpoint, checkpoint_transitions = self.checkpoints[-1]
+
+        sim = Simulation(self.circuit)
+        if checkpoint is None:
+            self.circuit.reset()
+            self.checkpoints = []
+            for time, gate_name, output in new_transitions:
+                sim.add_transition(gate_name, output, time)
+            sim.start()
+            probes = []
+        else:
+            sim.restore(self._restart_checkpoint(
+                sim, checkpoint, checkpoint_transitions, new_transitions))
+            probes = [probe for probe in self.probes
+                      if probe[0] <= checkpoint.time]
+        self.in_transitions = new_transitions
+        self.resumed_time = None if checkpoint is None else checkpoint.time
+
+        self.steps = 0
+        steps_since_checkpoint = 0
+        while len(sim.queue) > 0:
+            sim.step()
+            self.steps += 1
+            steps_since_checkpoint += 1
+            if (steps_since_checkpoint >= self.checkpoint_steps and
+                    len(sim.queue) > 0 and sim.queue.min().time > sim.time):
+                self.checkpoints.append((sim.checkpoint(False),
+                                         new_transitions))
+                steps_since_checkpoint = 0
+        sim.probes.sort()
+        self.probes = probes + sim.probes
+        return self.probes
+
+    @staticmethod
+    def _change_time(old_transitions, new_transitions):
+        # The earliest time of a transition in only one of two sorted lists.
+        for i in xrange(min(len(old_transitions), len(new_transitions))):
+            if old_transitions[i] != new_transitions[i]:
+                return min(old_transitions[i][0], new_transitions[i][0])
+        if len(old_transitions) > len(new_transitions):
+            return old_transitions[len(new_transitions)][0]
+        return new_transitions[len(old_transitions)][0]
+
+    def _restart_checkpoint(self, sim, checkpoint, old_transitions,
+                            new_transitions):
+        # A copy of a checkpoint whose stimulus is replaced by a new one.
+        #
+        # Input gates only receive stimulus transitions, so the pending
+        # transitions of the stimulus gates are the old stimulus, which is the
+        # stimulus of the run that took the checkpoint. The new stimulus goes
+        # through the same superseded-transition filter as in
+        # Simulation._schedule, starting from the gates' initial state (the
+        # circuit's initial_output), and the transitions after the checkpoint
+        # are queued ahead of the propagated ones, as if they had been queued
+        # by start().
+        sim._number_gates()
+        gate_numbers = sim.gate_numbers
+        stimulus_gates = set([gate_numbers[in_transition[1]]
+                              for in_transition in old_transitions +
+                              new_transitions])
+        scheduled_outputs = list(checkpoint.scheduled_outputs)
+        scheduled_times = list(checkpoint.scheduled_times)
+        for number in stimulus_gates:
+            scheduled_outputs[number] = self.circuit.initial_output
+            scheduled_times[number] = float('-inf')
+        stimulus = []
+        for time, gate_name, output in new_transitions:
+            number = gate_numbers[gate_name]
+            if time >= scheduled_times[number]:
+                if output == scheduled_outputs[number]:
+                    continue
+                scheduled_outputs[number] = output
+                scheduled_times[number] = time
+            if time > checkpoint.time:
+                stimulus.append([time, number, output])
+        propagated = [transition for transition in checkpoint.transitions
+                      if transition[1] not in stimulus_gates]
+        # The sort is stable, so the stimulus stays ahead at equal times.
+        transitions = sorted(stimulus + propagated,
+                             key=lambda transition: transition[0])
+        return Checkpoint(checkpoint.fingerprint, checkpoint.time,
+                          checkpoint.outputs, scheduled_outputs,
+                          scheduled_times, transitions, [])
+
+
+class BitParallelSimulation:
+    """Zero-delay simulation of many input vectors in a single pass.
+
+    Each gate's value is a word (an integer) whose k-th bit holds the gate's
+    output for the k-th input vector. The gates are evaluated once, in
+    topological order, using bitwise logic, so one pass through the circuit
+    computes the settled outputs for every vector.
+
+    The gate delays are ignored, so this only reports the values that the
+    gates settle to, not the transitions that lead there.
+    """
+
+    def __init__(self, circuit):
+        """Creates a bit-parallel simulation for a completely built circuit.
+
+        Args:
+            circuit: The circuit whose outputs will be computed.
+        
+        Raises:
+            ValueError: An exception if a gate's truth table outputs X or Z.
+        """
+        self.circuit = circuit
+        self.order = circuit.analysis().order
+        for gate in self.order:
+            if not gate.gate_type.truth_table.binary:
+                raise ValueError('Gate ' + gate.name + ' does not use binary '
+                                 'logic')
+        self.vectors = []
+        self.words = {}
+
+    def add_vector(self, inputs):
+        """Adds an input vector to be simulated.
+
+        Args:
+            inputs: A dictionary mapping the names of the circuit's input gates
+                to their 0/1 values. Input gates that are not mentioned keep
+                their current output.
+
+        Returns:
+            The index of the vector, to be used with outputs.
+
+        Raises:
+            ValueError: An exception if a gate is not an input gate, or if a
+                value is not 0 or 1.
+        """
+        for gate_name, value in inputs.items():
+            gate = self.circuit.gates[gate_name]
+            if gate.has_inputs_connected():
+                raise ValueError('Gate ' + gate.name + ' is not an input')
+            if value != 0 and value != 1:
+                raise ValueError('Invalid input value for gate ' + gate.name)
+        self.vectors.append(inputs)
+        return len(self.vectors) - 1
+
+    def run(self):
+        """Computes the outputs of all the gates for all the input vectors.
+
+        Raises:
+            ValueError: An exception if an input gate has an X or Z output,
+                and an input vector does not mention it.
+        """
+        mask = (1 << len(self.vectors)) - 1
+        words = {}
+        for gate in self.order:
+            if not gate.has_inputs_connected():
+                if gate.output != 0 and gate.output != 1:
+                    for vector in self.vectors:
+                        if gate.name not in vector:
+                            raise ValueError('Gate ' + gate.name + ' does '
+                                             'not have a binary output')
+                words[gate.name] = mask if gate.output == 1 else 0
+        for k in xrange(len(self.vectors)):
+            bit = 1 << k
+            for gate_name, value in self.vectors[k].items():
+                if value == 1:
+                    words[gate_name] |= bit
+                else:
+                    words[gate_name] &= ~bit
+
+        for gate in self.order:
+            if gate.has_inputs_connected():
+                words[gate.name] = gate.gate_type.word_output(
+                    [words[in_gate.name] for in_gate in gate.in_gates], mask)
+        self.words = words
+
+    def output(self, gate_name, index):
+        """The settled output of a gate for one of the input vectors.
+
+        Args:
+            gate_name: The name of the gate.
+            index: The input vector's index, as returned by add_vector.
+        """
+        return (self.words[gate_name] >> index) & 1
+
+    def outputs(self, index):
+        """The settled outputs of the probed gates for one input vector.
+
+        Returns:
+            A dictionary mapping the names of the probed gates to their values.
+        """
+        return dict([(gate.name, self.output(gate.name, index))
+                     for gate in self.order if gate.probed])
+
+
+class LevelizedSimulation:
+    """Zero-delay simulation that evaluates each gate exactly once.
+
+    The circuit is sorted into levels once, when the simulation is created. A
+    gate's level is one more than the highest level of the gates connected to
+    its inputs, so the gates on a level only depend on the gates on lower
+    levels. Gates are numbered level by level, and each level is evaluated as
+    a batch over its slice of the gate values array.
+
+    The gate delays are ignored, so this only reports the values that the
+    gates settle to, not the transitions that lead there.
+    """
+
+    def __init__(self, circuit):
+        """Compiles a completely built circuit for levelized evaluation.
+
+        Args:
+            circuit: The circuit whose outputs will be computed.
+        
+        Raises:
+            ValueError: An exception if a gate's truth table outputs X or Z.
+        """
+        self.circuit = circuit
+        analysis = circuit.analysis()
+
+        levels = analysis.levels
+        batches = {}
+        for gate in analysis.order:
+            if not gate.gate_type.truth_table.binary:
+                raise ValueError('Gate ' + gate.name + ' does not use binary '
+                                 'logic')
+            key = (levels[gate.name], len(gate.in_gates))
+            if key not in batches:
+                batches[key] = []
+            batches[key].append(gate)
+
+        # Number the gates so that each batch occupies a contiguous range.
+        self.gates = []
+        self.index = {}
+        for key in sorted(batches.keys()):
+            for gate in batches[key]:
+                self.index[gate.name] = len(self.gates)
+                self.gates.append(gate)
+        self.depth = analysis.depth
+        # The gates on level 0 come first. Their values are not computed from
+        # other gates, so run checks that they are 0 or 1.
+        self.level0_count = len([gate for gate in self.gates
+                                 if levels[gate.name] == 0])
+
+        # Each batch has the index of its first gate, the gates' truth tables,
+        # and one list of input indexes for each input terminal.
+        self.batches = []
+        for key in sorted(batches.keys()):
+            level, input_count = key
+            if level == 0:
+                continue
+            gates = batches[key]
+            tables = [gate.gate_type.truth_table.flat_table for gate in gates]
+            columns = [[self.index[gate.in_gates[i].name] for gate in gates]
+                       for i in xrange(input_count)]
+            self.batches.append((self.index[gates[0].name], tables, columns))
+        self.values = [gate.output for gate in self.gates]
+
+    def run(self, inputs):
+        """Computes the settled outputs of all gates for an input vector.
+
+        Args:
+            inputs: A dictionary mapping the names of the circuit's input gates
+                to their 0/1 values. Input gates that are not mentioned keep
+                their current output.
+
+        Raises:
+            ValueError: An exception if a gate is not an input gate, if a
+                value is not 0 or 1, or if an input gate that is not
+                mentioned has an X or Z output.
+        """
+        values = [gate.output for gate in self.gates]
+        for gate_name, value in inputs.items():
+            gate = self.circuit.gates[gate_name]
+            if gate.has_inputs_connected():
+                raise ValueError('Gate ' + gate.name + ' is not an input')
+            if value != 0 and value != 1:
+                raise ValueError('Invalid input value for gate ' + gate.name)
+            values[self.index[gate_name]] = value
+        for i in xrange(self.level0_count):
+            if values[i] != 0 and values[i] != 1:
+                raise ValueError('Gate ' + self.gates[i].name + ' does not '
+                                 'have a binary output')
+
+        for start, tables, columns in self.batches:
+            if len(columns) == 1:
+                results = [table[values[i]]
+                           for table, i in zip(tables, columns[0])]
+            elif len(columns) == 2:
+                results = [table[(values[i] << 1) | values[j]]
+                           for table, i, j in zip(tables, columns[0],
+                                                  columns[1])]
+            else:
+                results = []
+                for k in xrange(len(tables)):
+                    table_index = 0
+                    for column in columns:
+                        table_index = (table_index << 1) | values[column[k]]
+                    results.append(tables[k][table_index])
+            values[start:start + len(results)] = results
+        self.values = values
+
+    def output(self, gate_name):
+        """The settled output of a gate after the last call to run."""
+        return self.values[self.index[gate_name]]
+
+    def outputs(self):
+        """The settled outputs of the probed gates after the last call to run.
+
+        Returns:
+            A dictionary mapping the names of the probed gates to their values.
+        """
+        return dict([(gate.name, self.values[i])
+                     for i, gate in enumerate(self.gates) if gate.probed])
+
+    @staticmethod
+    def inputs_from_transitions(in_transitions):
+        """The final input values described by a simulation's transitions.
+
+        Args:
+            in_transitions: The in_transitions list of a Simulation instance.
+
+        Returns:
+            A dictionary mapping input gate names to the last value they take.
+        """
+        inputs = {}
+        for in_transition in sorted(in_transitions):
+            inputs[in_transition[1]] = in_transition[2]
+        return inputs
+
+    def outputs_to_file(self, file):
+        """Writes the settled outputs of the probed gates to a file.
+
+        Each line has the gate's name and its value, ordered by gate name.
+
+        Args:
+            file: A File object that receives the outputs.
+        """
+        outputs = self.outputs()
+        for gate_name in sorted(outputs.keys()):
+            file.write(gate_name + ' ' + str(outputs[gate_name]) + "\n")
 
 
 # Command-line controller.
 if __name__ == '__main__':
     import sys
-    sim = Simulation.from_file(sys.stdin)
+    if os.environ.get('CIRCUIT_CACHE'):
+        from circuit_cache import CircuitCache
+        cache = CircuitCache(os.environ['CIRCUIT_CACHE'])
+        sim = cache.load_simulation(getattr(sys.stdin, 'buffer', sys.stdin))
+    else:
+        sim = Simulation.from_file(sys.stdin)
+    if os.environ.get('INITIAL'):
+        # INITIAL=x starts the simulation with all gate outputs unknown.
+        sim.circuit.reset(parse_value(os.environ['INITIAL']))
+    if os.environ.get('ANALYSIS'):
+        # ANALYSIS names a file that receives the circuit's depth and
+        # critical path.
+        with open(os.environ['ANALYSIS'], 'w') as analysis_file:
+            sim.circuit.analysis().to_file(analysis_file)
+    if os.environ.get('ENGINE') == 'levelized':
+        levelized = LevelizedSimulation(sim.circuit)
+        levelized.run(LevelizedSimulation.inputs_from_transitions(
+            sim.in_transitions))
+        levelized.outputs_to_file(sys.stdout)
+        sys.exit(0)
+    if os.environ.get('ENGINE') == 'parallel':
+        # PARTITIONS is the number of worker processes, by default the number
+        # of CPUs.
+        from circuit_parallel import ParallelSimulation
+        ParallelSimulation(sim, int(os.environ['PARTITIONS'])
+                           if os.environ.get('PARTITIONS') else None).run()
+        sim.outputs_to_file(sys.stdout)
+        sys.exit(0)
+    if os.environ.get('STATS'):
+        sim.enable_stats()
+    checkpoint_path = os.environ.get('CHECKPOINT')
     if os.environ.get('TRACE') == 'jsonp':
         sim.layout_from_file(sys.stdin)
-        sim.probe_all_gates()
+        if not checkpoint_path:
+            sim.stream_jsonp_to(sys.stdout)
+        if not os.environ.get('PROBE'):
+            sim.probe_all_gates()
+    elif not checkpoint_path:
+        sim.stream_probes_to(sys.stdout)
+    # PROBE is a comma-separated list of glob patterns for the names of extra
+    # gates to probe. A pattern starting with re: is a regular expression.
+    for pattern in os.environ.get('PROBE', '').split(','):
+        if pattern.startswith('re:'):
+            pattern = re.compile(pattern[len('re:'):])
+        if pattern:
+            sim.probe_matching(pattern)
+    if (os.environ.get('PROBE_START') or os.environ.get('PROBE_END') or
+            os.environ.get('PROBE_EVERY')):
+        sim.filter_probes(
+            int(os.environ['PROBE_START']) if os.environ.get('PROBE_START')
+            else None,
+            int(os.environ['PROBE_END']) if os.environ.get('PROBE_END')
+            else None, int(os.environ.get('PROBE_EVERY') or '1'))
+    if checkpoint_path:
+        # Resume an interrupted run. Probe results are kept in the checkpoint
+        # instead of being streamed, so the complete output is written once
+        # the run finishes. With TRACE=jsonp, the trace is written by
+        # jsonp_to_file instead of being streamed by stream_jsonp_to.
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path, 'rb') as checkpoint_file:
+                sim.restore(Checkpoint.from_file(checkpoint_file))
+        sim.checkpoint_to(checkpoint_path,
+                          int(os.environ.get('CHECKPOINT_STEPS', '10000')))
     sim.run()
     if os.environ.get('TRACE') == 'jsonp':
         sim.undo_probe_all_gates()
-        sim.jsonp_to_file(sys.stdout)
-    else:
+        if checkpoint_path:
+            sim.jsonp_to_file(sys.stdout)
+        else:
+            sim.close_jsonp()
+    elif checkpoint_path:
         sim.outputs_to_file(sys.stdout)
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if os.environ.get('STATS'):
+        with open(os.environ['STATS'], 'w') as stats_file:
+            sim.stats.to_file(stats_file)
 
     # Testing:
     # queue = HeapPriorityQueue()
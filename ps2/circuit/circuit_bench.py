@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+
+import argparse    # Used to parse the command-line options
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess  # Used to measure each benchmark in a fresh process
+import sys
+import tempfile
+import time
+
+try:
+    import resource  # Used to measure peak memory; not available on Windows.
+except ImportError:
+    resource = None
+
+import circuit_gen
+from circuit import (BitParallelSimulation, LevelizedSimulation,
+                     PriorityQueue, Simulation)
+
+
+# Simulator benchmarks.
+
+class Benchmark:
+    """Times the simulation engines on the test corpus and synthetic circuits.
+
+    Each measurement runs in a separate Python process, so that the peak
+    memory reported for it only covers parsing and simulating its netlist.
+
+    A configuration names an engine, and for the event-driven engine, the
+    priority queue it uses:
+        * heap - Simulation with a HeapPriorityQueue
+        * array - Simulation with a PriorityQueue (linear-time pop)
+        * levelized - LevelizedSimulation on the final input values
+        * bitparallel - BitParallelSimulation on the final input values
+    The event-driven engines count the transitions popped from the queue as
+    events. The other engines count each gate evaluation as an event.
+    """
+
+    CONFIGURATIONS = ['heap', 'array', 'levelized', 'bitparallel']
+
+    # Synthetic cases are named after the generator and its size parameter.
+    SYNTHETIC_CASES = ['sort256', 'sort1024', 'mult16', 'mult32', 'add1024',
+                       'prefix1024', 'dag100k']
+    # Maps the names used in synthetic cases to circuit_gen generators.
+    SYNTHETIC_KINDS = {'add': 'adder', 'prefix': 'prefix_adder',
+                       'mult': 'multiplier', 'sort': 'sorter', 'dag': 'dag'}
+
+    # Runs shorter than this are too noisy to compare their speed.
+    MIN_COMPARED_SECONDS = 0.05
+
+    def __init__(self, cases, configurations=None, time_limit=60):
+        """Creates a benchmark.
+
+        Args:
+            cases: A list of netlist paths and synthetic case names.
+            configurations: The engine configurations to measure. Defaults to
+                all the configurations.
+            time_limit: The number of seconds a measurement may take before it
+                is stopped and reported as timed out.
+        """
+        self.cases = cases
+        self.configurations = configurations or Benchmark.CONFIGURATIONS
+        self.time_limit = time_limit
+
+    def run(self, report=None):
+        """Measures every configuration on every case.
+
+        Args:
+            report: Called with each result as soon as it is measured.
+
+        Returns:
+            A list of results, as returned by Benchmark.measure, with added
+            'case' and 'configuration' keys. Measurements that fail or time
+            out have a 'status' other than 'ok', and no other measurements.
+        """
+        results = []
+        temp_dir = tempfile.mkdtemp()
+        try:
+            for case in self.cases:
+                path = case
+                if not os.path.exists(case):
+                    path = os.path.join(temp_dir, case + '.in')
+                    with open(path, 'w') as netlist_file:
+                        Benchmark.synthesize(case, netlist_file)
+                for configuration in self.configurations:
+                    result = self._measure_in_child(path, configuration)
+                    result['case'] = os.path.basename(case)
+                    result['configuration'] = configuration
+                    results.append(result)
+                    if report is not None:
+                        report(result)
+        finally:
+            shutil.rmtree(temp_dir)
+        return results
+
+    def _measure_in_child(self, path, configuration):
+        # Runs Benchmark.measure in a new process, and returns its result.
+        with tempfile.TemporaryFile() as out_file:
+            child = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--measure',
+                 path, configuration], stdout=out_file)
+            deadline = time.time() + self.time_limit
+            while child.poll() is None:
+                if time.time() > deadline:
+                    child.kill()
+                    child.wait()
+                    return {'status': 'timeout'}
+                time.sleep(0.05)
+            if child.returncode != 0:
+                return {'status': 'failed'}
+            out_file.seek(0)
+            return json.loads(out_file.read().decode('utf-8'))
+
+    @staticmethod
+    def measure(path, configuration):
+        """Parses and simulates a netlist in the current process.
+
+        Args:
+            path: The path to a simulator input file.
+            configuration: One of Benchmark.CONFIGURATIONS.
+
+        Returns:
+            A hash that obeys the JSON format, with the parse and run times in
+            seconds, the number of events, the events processed per second,
+            and the process's peak memory use in kilobytes.
+        """
+        with open(path) as in_file:
+            sim = Simulation.from_file(in_file)
+        if configuration == 'heap' or configuration == 'array':
+            if configuration == 'array':
+                sim.queue = PriorityQueue()
+            stats = sim.enable_stats()
+            start_time = time.time()
+            sim.run()
+            run_seconds = time.time() - start_time
+            events = stats.events_applied + stats.events_discarded
+        else:
+            inputs = LevelizedSimulation.inputs_from_transitions(
+                sim.in_transitions)
+            start_time = time.time()
+            if configuration == 'levelized':
+                engine = LevelizedSimulation(sim.circuit)
+                engine.run(inputs)
+            elif configuration == 'bitparallel':
+                engine = BitParallelSimulation(sim.circuit)
+                engine.add_vector(inputs)
+                engine.run()
+            else:
+                raise ValueError('Unknown configuration ' + configuration)
+            run_seconds = time.time() - start_time
+            events = len(sim.circuit.gates)
+        return {'status': 'ok',
+                'parse_seconds': sim.parse_stats['seconds'],
+                'run_seconds': run_seconds,
+                'events': events,
+                'events_per_second': events / max(run_seconds, 1e-9),
+                'peak_memory_kb': Benchmark.peak_memory_kb()}
+
+    @staticmethod
+    def peak_memory_kb():
+        """The current process's peak resident memory, in kilobytes.
+
+        Returns None on platforms without the resource module.
+        """
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            peak //= 1024  # macOS reports bytes instead of kilobytes.
+        return peak
+
+    @staticmethod
+    def synthesize(case, file):
+        """Writes the netlist for a synthetic case.
+
+        Args:
+            case: A circuit name from Benchmark.SYNTHETIC_KINDS followed by its
+                size, like 'sort256' (a 256-input sorting network), 'mult32'
+                (a 32x32-bit multiplier) or 'dag1m' (a random circuit with a
+                million gates).
+            file: A File object that receives the netlist.
+        """
+        match = re.match(r'^([a-z]+)(\d+)([km]?)$', case)
+        if match is None or match.group(1) not in Benchmark.SYNTHETIC_KINDS:
+            raise ValueError('Unknown synthetic case ' + case)
+        size = int(match.group(2)) * {'': 1, 'k': 1000,
+                                      'm': 1000000}[match.group(3)]
+        kind = Benchmark.SYNTHETIC_KINDS[match.group(1)]
+        # Random circuits have too many outputs to probe them all.
+        max_probes = 64 if kind == 'dag' else None
+        circuit_gen.generate(file, kind, size, max_probes=max_probes)
+
+    @staticmethod
+    def compare(results, baseline, threshold):
+        """Finds the results that regressed relative to a baseline.
+
+        Args:
+            results: A list of results returned by Benchmark.run.
+            baseline: A list of results from an earlier run.
+            threshold: The fraction by which the events per second may drop,
+                or the peak memory may grow, before a result is a regression.
+
+        Returns:
+            A list of [case, configuration, message] regressions.
+        """
+        previous = dict([((result['case'], result['configuration']), result)
+                         for result in baseline])
+        regressions = []
+        for result in results:
+            key = (result['case'], result['configuration'])
+            if key not in previous or previous[key]['status'] != 'ok':
+                continue
+            old = previous[key]
+            if result['status'] != 'ok':
+                regressions.append([key[0], key[1], result['status']])
+                continue
+            if (min(result['run_seconds'], old['run_seconds']) >=
+                    Benchmark.MIN_COMPARED_SECONDS and
+                    result['events_per_second'] <
+                    old['events_per_second'] * (1 - threshold)):
+                regressions.append([key[0], key[1], '%.0f events/s, was %.0f' %
+                                    (result['events_per_second'],
+                                     old['events_per_second'])])
+            if (result['peak_memory_kb'] is not None and
+                    old['peak_memory_kb'] is not None and
+                    result['peak_memory_kb'] >
+                    old['peak_memory_kb'] * (1 + threshold)):
+                regressions.append([key[0], key[1], '%d KB peak, was %d' %
+                                    (result['peak_memory_kb'],
+                                     old['peak_memory_kb'])])
+        return regressions
+
+    @staticmethod
+    def format_result(result):
+        """A line describing a result, for the benchmark's report."""
+        prefix = '%-16s %-12s' % (result['case'], result['configuration'])
+        if result['status'] != 'ok':
+            return prefix + ' ' + result['status']
+        memory = result['peak_memory_kb']
+        return prefix + ' %10d events %8.3fs %12.0f events/s %8s KB' % (
+            result['events'], result['run_seconds'],
+            result['events_per_second'],
+            '-' if memory is None else str(memory))
+
+
+# Command-line controller.
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--measure':
+        json.dump(Benchmark.measure(sys.argv[2], sys.argv[3]), sys.stdout)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(
+        description='Times the circuit simulator engines.')
+    parser.add_argument('cases', nargs='*',
+                        help='netlist paths or synthetic case names (default: '
+                        'tests/*.in and ' +
+                        ' '.join(Benchmark.SYNTHETIC_CASES) + ')')
+    parser.add_argument('--configurations', default=None,
+                        help='comma-separated subset of ' +
+                        ','.join(Benchmark.CONFIGURATIONS))
+    parser.add_argument('--time-limit', type=float, default=60,
+                        help='seconds allowed per measurement (default: 60)')
+    parser.add_argument('--save', metavar='BASELINE',
+                        help='write the results to a baseline file')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='flag regressions relative to a baseline file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed slowdown or memory growth, as a '
+                        'fraction (default: 0.2)')
+    args = parser.parse_args()
+
+    cases = args.cases
+    if not cases:
+        cases = sorted(glob.glob(os.path.join(os.path.dirname(
+            os.path.abspath(__file__)), 'tests', '*.in')))
+        cases += Benchmark.SYNTHETIC_CASES
+    configurations = None
+    if args.configurations:
+        configurations = args.configurations.split(',')
+
+    benchmark = Benchmark(cases, configurations, args.time_limit)
+    results = benchmark.run(
+        lambda result: print(Benchmark.format_result(result)))
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = Benchmark.compare(results, json.load(baseline_file),
+                                            args.threshold)
+        for case, configuration, message in regressions:
+            print('REGRESSION %s %s: %s' % (case, configuration, message))
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+import tempfile
+from circuit_bench import *
+
+
+class BenchmarkTest(unittest.TestCase):
+    def _result(self, case, configuration, events_per_second, memory):
+        return {'case': case, 'configuration': configuration, 'status': 'ok',
+                'parse_seconds': 0.1, 'run_seconds': 1.0, 'events': 1000,
+                'events_per_second': events_per_second,
+                'peak_memory_kb': memory}
+
+    def testMeasure(self):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   '4sort.in')
+        for configuration in Benchmark.CONFIGURATIONS:
+            result = Benchmark.measure(in_filename, configuration)
+            self.assertEqual('ok', result['status'])
+            self.assertTrue(result['events'] > 0)
+
+    def testSynthesize(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            with open(path, 'w') as netlist_file:
+                Benchmark.synthesize('sort16', netlist_file)
+            with open(path) as netlist_file:
+                sim = Simulation.from_file(netlist_file)
+        finally:
+            os.remove(path)
+        self.assertEqual(16 + 2 * 80, len(sim.circuit.gates))
+        sim.run()
+        values = {}
+        for time, gate_name, value in sim.probes:
+            values[gate_name] = value
+        inputs = LevelizedSimulation.inputs_from_transitions(sim.in_transitions)
+        # The sorter's outputs are a permutation of its inputs.
+        self.assertEqual(sum(inputs.values()), sum(values.values()))
+
+    def testSynthesizeUnknownCase(self):
+        with tempfile.TemporaryFile(mode='w') as netlist_file:
+            self.assertRaises(ValueError, Benchmark.synthesize, 'fft64',
+                              netlist_file)
+
+    def testCompare(self):
+        baseline = [self._result('a', 'heap', 1000.0, 1000),
+                    self._result('b', 'heap', 1000.0, 1000),
+                    self._result('c', 'heap', 1000.0, 1000)]
+        results = [self._result('a', 'heap', 900.0, 1100),
+                   self._result('b', 'heap', 500.0, 1000),
+                   self._result('c', 'heap', 1000.0, 2000),
+                   self._result('d', 'heap', 1.0, 9999)]
+        regressions = Benchmark.compare(results, baseline, 0.2)
+        self.assertEqual([['b', 'heap'], ['c', 'heap']],
+                         [regression[0:2] for regression in regressions])
+
+    def testCompareShortRuns(self):
+        baseline = [self._result('a', 'heap', 1000.0, 1000)]
+        result = self._result('a', 'heap', 10.0, 1000)
+        result['run_seconds'] = 0.001
+        self.assertEqual([], Benchmark.compare([result], baseline, 0.2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+import gc       # Used to pause garbage collection while loading
+import hashlib  # Used to key cached circuits by the netlist's contents
+import io       # Used to parse netlists that are already in memory
+import mmap     # Used to read compiled circuits without copying them
+import os
+import struct
+import sys
+import zlib     # Used to detect damaged compiled circuits
+
+from circuit import BinaryReader, BinaryWriter, Circuit, Gate, Simulation
+
+# Python 3 doesn't have xrange, and range behaves like xrange.
+if sys.version_info >= (3,):
+    xrange = range
+
+
+# Compiled circuit serialization.
+
+class CompiledCircuit:
+    """Compact binary representation of a simulation's circuit and inputs.
+
+    Gates are numbered in topological order. A compiled circuit contains, in
+    order:
+        * a header with the format's magic number and version
+        * the names of all truth tables, gate types and gates
+        * the truth tables, as flat output lists
+        * the gate types, as truth table numbers and delays
+        * the gates, as gate type numbers and probe flags
+        * the gates' inputs and outputs, in compressed sparse row (CSR) form
+        * the simulation's initial transitions
+        * the input text that follows the done command (the layout)
+        * a CRC-32 checksum of everything above
+    All numbers are little-endian.
+    """
+
+    MAGIC = b'CIRC'
+    VERSION = 2
+
+    @staticmethod
+    def write(simulation, file):
+        """Writes a simulation's circuit and initial transitions to a file.
+
+        Args:
+            simulation: A Simulation instance that has not been run yet.
+            file: A File object opened in binary mode.
+        """
+        circuit = simulation.circuit
+        tables = list(circuit.truth_tables.values())
+        table_numbers = dict([(tables[i].name, i)
+                              for i in xrange(len(tables))])
+        gate_types = list(circuit.gate_types.values())
+        type_numbers = dict([(gate_types[i].name, i)
+                             for i in xrange(len(gate_types))])
+        gates = circuit.topological_order()
+        gate_numbers = dict([(gates[i].name, i) for i in xrange(len(gates))])
+
+        in_offsets, in_numbers = CompiledCircuit._csr(
+            [[-1 if in_gate is None else gate_numbers[in_gate.name]
+              for in_gate in gate.in_gates] for gate in gates])
+        out_offsets, out_numbers = CompiledCircuit._csr(
+            [[gate_numbers[out_gate.name] for out_gate in gate.out_gates]
+             for gate in gates])
+
+        # The checksum covers the whole file, so it is assembled in memory.
+        body = io.BytesIO()
+        writer = BinaryWriter(body)
+        writer.raw(CompiledCircuit.MAGIC)
+        writer.ints([CompiledCircuit.VERSION])
+        writer.strings([table.name for table in tables] +
+                       [gate_type.name for gate_type in gate_types] +
+                       [gate.name for gate in gates])
+        writer.ints([len(tables), len(gate_types), len(gates),
+                     len(in_numbers), len(out_numbers),
+                     len(simulation.in_transitions)])
+
+        writer.ints([len(table.flat_table) for table in tables])
+        writer.bytes([value for table in tables for value in table.flat_table])
+        writer.ints([table_numbers[gate_type.truth_table.name]
+                     for gate_type in gate_types])
+        writer.longs([gate_type.delay for gate_type in gate_types])
+        writer.ints([type_numbers[gate.gate_type.name] for gate in gates])
+        writer.bytes([1 if gate.probed else 0 for gate in gates])
+        writer.ints(in_offsets)
+        writer.ints(in_numbers)
+        writer.ints(out_offsets)
+        writer.ints(out_numbers)
+
+        in_transitions = simulation.in_transitions
+        writer.longs([in_transition[0] for in_transition in in_transitions])
+        writer.ints([gate_numbers[in_transition[1]]
+                     for in_transition in in_transitions])
+        writer.bytes([in_transition[2] for in_transition in in_transitions])
+        writer.strings([simulation.unread_input])
+        data = body.getvalue()
+        file.write(data)
+        file.write(struct.pack('<I', zlib.crc32(data) & 0xffffffff))
+
+    @staticmethod
+    def load(path):
+        """Builds a simulation from a compiled circuit file.
+
+        The file is memory-mapped, and the circuit's objects are created
+        directly from its arrays, without name lookups or validation.
+
+        Args:
+            path: The path to a file produced by CompiledCircuit.write.
+
+        Returns:
+            A new Simulation instance.
+
+        Raises:
+            ValueError: An exception if the file is not a compiled circuit, was
+                produced by a different version of this code, or was damaged.
+        """
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size - 4
+            if size < 0:
+                raise ValueError('Damaged compiled circuit file')
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            if (struct.unpack('<I', buffer[size:])[0] !=
+                    _checksum(buffer, size)):
+                buffer.close()
+                raise ValueError('Damaged compiled circuit file')
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                return CompiledCircuit._read(BinaryReader(buffer))
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+                buffer.close()
+
+    @staticmethod
+    def _read(reader):
+        # Builds a Simulation out of the data supplied by a BinaryReader.
+        if (reader.raw(len(CompiledCircuit.MAGIC)) != CompiledCircuit.MAGIC or
+                reader.ints(1)[0] != CompiledCircuit.VERSION):
+            raise ValueError('Not a compiled circuit file for this version')
+        names = reader.strings()
+        (table_count, type_count, gate_count, in_count, out_count,
+         transition_count) = reader.ints(6)
+        table_names = names[0:table_count]
+        type_names = names[table_count:table_count + type_count]
+        gate_names = names[table_count + type_count:]
+
+        circuit = Circuit()
+        table_lengths = reader.ints(table_count)
+        outputs = reader.bytes(sum(table_lengths))
+        offset = 0
+        for i in xrange(table_count):
+            circuit.add_truth_table(table_names[i], list(
+                outputs[offset:offset + table_lengths[i]]))
+            offset += table_lengths[i]
+        table_numbers = reader.ints(type_count)
+        delays = reader.longs(type_count)
+        for i in xrange(type_count):
+            circuit.add_gate_type(type_names[i], table_names[table_numbers[i]],
+                                  delays[i])
+
+        gate_types = [circuit.gate_types[name] for name in type_names]
+        type_numbers = reader.ints(gate_count)
+        probed = reader.bytes(gate_count)
+        gates = [Gate(gate_names[i], gate_types[type_numbers[i]])
+                 for i in xrange(gate_count)]
+        in_offsets = reader.ints(gate_count + 1)
+        in_numbers = reader.ints(in_count)
+        out_offsets = reader.ints(gate_count + 1)
+        out_numbers = reader.ints(out_count)
+        # Resolve all the numbers to gates at once, then slice the results.
+        in_gates = [None if number < 0 else gates[number]
+                    for number in in_numbers]
+        out_gates = [gates[number] for number in out_numbers]
+        for i in xrange(gate_count):
+            gate = gates[i]
+            gate.in_gates = in_gates[in_offsets[i]:in_offsets[i + 1]]
+            gate.out_gates = out_gates[out_offsets[i]:out_offsets[i + 1]]
+            if probed[i] == 1:
+                gate.probed = True
+        circuit.gates = dict(zip(gate_names, gates))
+
+        simulation = Simulation(circuit)
+        times = reader.longs(transition_count)
+        gate_numbers = reader.ints(transition_count)
+        values = reader.bytes(transition_count)
+        simulation.in_transitions = [
+            [times[i], gate_names[gate_numbers[i]], values[i],
+             gates[gate_numbers[i]]] for i in xrange(transition_count)]
+        simulation.unread_input = reader.strings()[0]
+        return simulation
+
+    @staticmethod
+    def _csr(lists):
+        # Packs a list of lists into an offsets array and a values array.
+        offsets = [0]
+        values = []
+        for items in lists:
+            values.extend(items)
+            offsets.append(len(values))
+        return offsets, values
+
+
+def _checksum(data, size):
+    # The CRC-32 of the first size bytes of a buffer, without copying them.
+    if sys.version_info >= (3,):
+        with memoryview(data) as view:
+            with view[:size] as payload:
+                return zlib.crc32(payload) & 0xffffffff
+    return zlib.crc32(buffer(data, 0, size)) & 0xffffffff
+
+
+class CircuitCache:
+    """A directory of compiled circuits, keyed by their netlists' contents.
+
+    Loading a netlist that was seen before skips parsing it.
+    """
+
+    def __init__(self, directory):
+        """Creates a cache that stores compiled circuits in a directory.
+
+        Args:
+            directory: Path to the cache directory. It is created if needed.
+        """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path_for(self, data):
+        """The path of the compiled circuit for a netlist's contents."""
+        digest = hashlib.sha256(data).hexdigest()
+        return os.path.join(self.directory, digest + '.circ')
+
+    def load_simulation(self, file):
+        """Builds a simulation from a netlist, using the cache if possible.
+
+        Args:
+            file: A File object opened in binary mode, supplying the netlist.
+
+        Returns:
+            A new Simulation instance.
+        """
+        data = file.read()
+        path = self.path_for(data)
+        if os.path.exists(path):
+            try:
+                return CompiledCircuit.load(path)
+            except (ValueError, struct.error):
+                pass  # Stale or damaged entry, rebuild it.
+
+        if sys.version_info >= (3,):
+            text_file = io.StringIO(data.decode('utf-8'))
+        else:
+            text_file = io.BytesIO(data)
+        simulation = Simulation.from_file(text_file)
+        # Write to a temporary file first, so concurrent runs never read a
+        # partially written entry.
+        temp_path = path + '.' + str(os.getpid())
+        with open(temp_path, 'wb') as compiled_file:
+            CompiledCircuit.write(simulation, compiled_file)
+        os.rename(temp_path, path)
+        return simulation
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import unittest
+import glob
+import io
+import os
+import re
+import shutil
+import tempfile
+from circuit_cache import *
+
+
+class CircuitCacheTest(unittest.TestCase):
+    def setUp(self):
+        dir = os.path.dirname(__file__)
+        # The small test cases; the large ones are covered by circuit_test.py.
+        self._in_files = [name for name in
+                          glob.glob(os.path.join(dir, 'tests', '*.in'))
+                          if name.find('devadas') < 0]
+        self._in_files.sort()
+        self._cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._cache_dir)
+
+    def _outputs(self, sim):
+        sim.run()
+        return sim.outputs_to_line_list()
+
+    def testCacheHit(self):
+        cache = CircuitCache(self._cache_dir)
+        for in_filename in self._in_files:
+            with open(in_filename, 'rb') as in_file:
+                miss_sim = cache.load_simulation(in_file)
+            with open(in_filename, 'rb') as in_file:
+                self.assertTrue(os.path.exists(cache.path_for(in_file.read())))
+            with open(in_filename, 'rb') as in_file:
+                hit_sim = cache.load_simulation(in_file)
+            self.assertEqual(miss_sim.unread_input, hit_sim.unread_input)
+
+            gold_filename = re.sub('\.in$', '.gold', in_filename)
+            with open(gold_filename) as gold_file:
+                gold_lines = [line.strip() for line in gold_file]
+            self.assertEqual(gold_lines, self._outputs(miss_sim))
+            self.assertEqual(gold_lines, self._outputs(hit_sim))
+
+    def testDamagedEntry(self):
+        cache = CircuitCache(self._cache_dir)
+        in_filename = self._in_files[0]
+        with open(in_filename, 'rb') as in_file:
+            data = in_file.read()
+        with open(cache.path_for(data), 'wb') as damaged_file:
+            damaged_file.write(b'CIRC')
+        with open(in_filename, 'rb') as in_file:
+            sim = cache.load_simulation(in_file)
+        self.assertEqual(len(sim.circuit.gates),
+                         len(CompiledCircuit.load(cache.path_for(data))
+                             .circuit.gates))
+
+    def testCorruptedEntry(self):
+        cache = CircuitCache(self._cache_dir)
+        in_filename = self._in_files[0]
+        with open(in_filename, 'rb') as in_file:
+            data = in_file.read()
+        expected = self._outputs(cache.load_simulation(io.BytesIO(data)))
+        path = cache.path_for(data)
+        with open(path, 'rb') as entry_file:
+            entry = entry_file.read()
+        for offset in range(0, len(entry), 7):
+            damaged = bytearray(entry)
+            damaged[offset] ^= 0x41
+            with open(path, 'wb') as damaged_file:
+                damaged_file.write(bytes(damaged))
+            self.assertRaises(ValueError, CompiledCircuit.load, path)
+            self.assertEqual(expected, self._outputs(
+                cache.load_simulation(io.BytesIO(data))))
+            # The damaged entry was replaced.
+            self.assertEqual(expected, self._outputs(
+                CompiledCircuit.load(path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
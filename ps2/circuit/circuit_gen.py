@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+
+import random  # Used to generate random stimulus
+import sys
+
+# Python 3 doesn't have xrange, and range behaves like xrange.
+if sys.version_info >= (3,):
+    xrange = range
+
+
+# Synthetic netlist generation.
+
+class NetlistBuilder:
+    """Writes a netlist in the simulator's input format, one gate at a time.
+
+    The netlist is written as it is built, so the memory used does not depend
+    on the circuit's size. Netlists must be built in order: gates, then
+    probes, then input transitions, then done.
+    """
+
+    # Truth tables and gate types available to generated circuits. The delays
+    # are different, so that inputs arriving over different paths glitch.
+    TABLES = [('eq', '0 1'), ('not', '1 0'), ('and2', '0 0 0 1'),
+              ('or2', '0 1 1 1'), ('xor2', '0 1 1 0'), ('nand2', '1 1 1 0'),
+              ('nor2', '1 0 0 0')]
+    TYPES = [('in', 'eq', 0), ('not', 'not', 2), ('and2', 'and2', 5),
+             ('or2', 'or2', 6), ('xor2', 'xor2', 8), ('nand2', 'nand2', 4),
+             ('nor2', 'nor2', 4)]
+
+    def __init__(self, file):
+        """Starts a netlist by writing the truth tables and gate types.
+
+        Args:
+            file: A File object that receives the netlist.
+        """
+        self.file = file
+        self.gate_count = 0
+        self.inputs = []
+        self.outputs = []
+        for name, outputs in NetlistBuilder.TABLES:
+            file.write('table ' + name + ' ' + outputs + '\n')
+        for name, table, delay in NetlistBuilder.TYPES:
+            file.write('type ' + name + ' ' + table + ' ' + str(delay) + '\n')
+
+    def input(self, name):
+        """Adds an input gate, and returns its name."""
+        self.file.write('gate ' + name + ' in\n')
+        self.gate_count += 1
+        self.inputs.append(name)
+        return name
+
+    def gate(self, type_name, input_names):
+        """Adds a gate with an automatically generated name.
+
+        Args:
+            type_name: One of the names in NetlistBuilder.TYPES.
+            input_names: The names of the gates connected to the inputs.
+
+        Returns:
+            The new gate's name.
+        """
+        name = 'g' + str(self.gate_count)
+        self.file.write('gate ' + name + ' ' + type_name + ' ' +
+                        ' '.join(input_names) + '\n')
+        self.gate_count += 1
+        return name
+
+    def probe(self, name):
+        """Marks a gate as one of the circuit's outputs."""
+        self.file.write('probe ' + name + '\n')
+        self.outputs.append(name)
+
+    def flip(self, name, value, time):
+        """Adds a transition of an input gate's output."""
+        self.file.write('flip ' + name + ' ' + str(value) + ' ' + str(time) +
+                        '\n')
+
+    def done(self):
+        """Ends the netlist."""
+        self.file.write('done\n')
+
+
+def sorter(builder, width):
+    """Builds a bitonic sorting network for 1-bit values.
+
+    Each comparator is an AND gate (the minimum) and an OR gate (the maximum).
+
+    Args:
+        builder: The NetlistBuilder receiving the gates.
+        width: The number of values sorted. Must be a power of two.
+
+    Returns:
+        The names of the sorted outputs, smallest first.
+    """
+    if width < 2 or width & (width - 1) != 0:
+        raise ValueError('Sorter width must be a power of two')
+    wires = [builder.input('i' + str(i)) for i in xrange(width)]
+    k = 2
+    while k <= width:
+        j = k // 2
+        while j > 0:
+            for i in xrange(width):
+                other = i ^ j
+                if other > i:
+                    low = builder.gate('and2', [wires[i], wires[other]])
+                    high = builder.gate('or2', [wires[i], wires[other]])
+                    if i & k == 0:
+                        wires[i], wires[other] = low, high
+                    else:
+                        wires[i], wires[other] = high, low
+            j //= 2
+        k *= 2
+    return wires
+
+
+def add(builder, x, y):
+    """Builds a ripple-carry adder.
+
+    Args:
+        builder: The NetlistBuilder receiving the gates.
+        x, y: The names of the gates holding the numbers' bits, least
+            significant first. None stands for a bit that is always 0.
+
+    Returns:
+        The names of the sum's bits, least significant first.
+    """
+    result = []
+    carry = None
+    for k in xrange(max(len(x), len(y))):
+        bits = [bit for bit in [x[k] if k < len(x) else None,
+                                y[k] if k < len(y) else None, carry]
+                if bit is not None]
+        if len(bits) == 0:
+            result.append(None)
+            carry = None
+        elif len(bits) == 1:
+            result.append(bits[0])
+            carry = None
+        elif len(bits) == 2:
+            result.append(builder.gate('xor2', bits))
+            carry = builder.gate('and2', bits)
+        else:
+            half_sum = builder.gate('xor2', bits[0:2])
+            result.append(builder.gate('xor2', [half_sum, bits[2]]))
+            carry = builder.gate('or2', [
+                builder.gate('and2', bits[0:2]),
+                builder.gate('and2', [half_sum, bits[2]])])
+    if carry is not None:
+        result.append(carry)
+    return result
+
+
+def adder(builder, width):
+    """Builds a ripple-carry adder for two numbers.
+
+    Args:
+        builder: The NetlistBuilder receiving the gates.
+        width: The number of bits in each number.
+
+    Returns:
+        The names of the sum's bits, least significant first.
+    """
+    a = [builder.input('a' + str(i)) for i in xrange(width)]
+    b = [builder.input('b' + str(i)) for i in xrange(width)]
+    return add(builder, a, b)
+
+
+def prefix_adder(builder, width):
+    """Builds a Kogge-Stone parallel-prefix adder for two numbers.
+
+    The carries are computed in a logarithmic number of levels, so the adder
+    is much shallower, and much larger, than a ripple-carry adder.
+
+    Args:
+        builder: The NetlistBuilder receiving the gates.
+        width: The number of bits in each number.
+
+    Returns:
+        The names of the sum's bits, least significant first.
+    """
+    a = [builder.input('a' + str(i)) for i in xrange(width)]
+    b = [builder.input('b' + str(i)) for i in xrange(width)]
+    propagate = [builder.gate('xor2', [a[i], b[i]]) for i in xrange(width)]
+    # generate[i] and group[i] describe the bits from i - distance + 1 to i.
+    generate = [builder.gate('and2', [a[i], b[i]]) for i in xrange(width)]
+    group = list(propagate)
+    distance = 1
+    while distance < width:
+        next_generate = list(generate)
+        next_group = list(group)
+        for i in xrange(distance, width):
+            next_generate[i] = builder.gate('or2', [generate[i], builder.gate(
+                'and2', [group[i], generate[i - distance]])])
+            next_group[i] = builder.gate('and2', [group[i],
+                                                  group[i - distance]])
+        generate, group = next_generate, next_group
+        distance *= 2
+    return ([propagate[0]] +
+            [builder.gate('xor2', [propagate[i], generate[i - 1]])
+             for i in xrange(1, width)] + [generate[width - 1]])
+
+
+def multiplier(builder, width):
+    """Builds an array multiplier.
+
+    Args:
+        builder: The NetlistBuilder receiving the gates.
+        width: The number of bits in each factor.
+
+    Returns:
+        The names of the product's bits, least significant first.
+    """
+    a = [builder.input('a' + str(i)) for i in xrange(width)]
+    b = [builder.input('b' + str(i)) for i in xrange(width)]
+    product = [builder.gate('and2', [a[j], b[0]]) for j in xrange(width)]
+    for i in xrange(1, width):
+        row = [None] * i + [builder.gate('and2', [a[j], b[i]])
+                            for j in xrange(width)]
+        product = add(builder, product, row)
+    return product
+
+
+def random_dag(builder, gate_count, input_count, window=1000, seed=None):
+    """Builds a random acyclic circuit.
+
+    Each gate's inputs are picked among the window gates created right before
+    it, so the circuit's depth grows with its size, like in real designs.
+
+    Args:
+        builder: The NetlistBuilder receiving the gates.
+        gate_count: The number of gates, including the input gates.
+        input_count: The number of input gates.
+        window: The number of preceding gates that a gate's inputs come from.
+        seed: Seed for the random number generator, for reproducible netlists.
+
+    Returns:
+        The names of the gates whose outputs are not connected to other gates.
+    """
+    generator = random.Random(seed)
+    types = ['not', 'and2', 'or2', 'xor2', 'nand2', 'nor2']
+    first = builder.gate_count
+    names = [builder.input('i' + str(i)) for i in xrange(input_count)]
+    connected = bytearray(gate_count)
+    for k in xrange(input_count, gate_count):
+        type_name = types[generator.randrange(len(types))]
+        low = max(0, k - window)
+        in_numbers = [generator.randrange(low, k)
+                      for i in xrange(1 if type_name == 'not' else 2)]
+        in_names = []
+        for number in in_numbers:
+            connected[number] = 1
+            if number < input_count:
+                in_names.append(names[number])
+            else:
+                # Generated gates are named after their position.
+                in_names.append('g' + str(first + number))
+        builder.gate(type_name, in_names)
+    return ['g' + str(first + k) for k in xrange(input_count, gate_count)
+            if connected[k] == 0]
+
+
+def random_stimulus(builder, steps, density, period, seed=None):
+    """Adds random transitions to the builder's input gates.
+
+    Args:
+        builder: The NetlistBuilder whose inputs receive the transitions.
+        steps: The number of times when inputs may change.
+        density: The probability that an input changes at each of those times.
+        period: The time between two consecutive changes.
+        seed: Seed for the random number generator, for reproducible netlists.
+    """
+    generator = random.Random(seed)
+    values = dict([(name, 0) for name in builder.inputs])
+    for step in xrange(1, steps + 1):
+        for name in builder.inputs:
+            if generator.random() < density:
+                values[name] = 1 - values[name]
+                builder.flip(name, values[name], step * period)
+
+
+# Circuits that generate() can build. Each generator takes a builder and a
+# size, and returns the names of the circuit's outputs.
+GENERATORS = {
+    'adder': adder,
+    'prefix_adder': prefix_adder,
+    'multiplier': multiplier,
+    'sorter': sorter,
+    'dag': lambda builder, size: random_dag(builder, size,
+                                            max(1, size // 100), seed=size)
+}
+
+
+def generate(file, kind, size, steps=8, density=0.5, period=1000,
+             max_probes=None, seed=0):
+    """Writes a complete netlist, with probes and random stimulus.
+
+    Args:
+        file: A File object that receives the netlist.
+        kind: One of the keys in GENERATORS.
+        size: The width of an adder, multiplier or sorter, or the number of
+            gates in a random DAG.
+        steps: The number of times when inputs may change.
+        density: The probability that an input changes at each of those times.
+        period: The time between two consecutive input changes.
+        max_probes: The largest number of outputs to probe, for circuits
+            with many outputs. Defaults to all the outputs.
+        seed: Seed for the random stimulus.
+
+    Returns:
+        The NetlistBuilder that wrote the netlist.
+    """
+    if kind not in GENERATORS:
+        raise ValueError('Unknown circuit kind ' + kind)
+    builder = NetlistBuilder(file)
+    outputs = GENERATORS[kind](builder, size)
+    if max_probes is not None:
+        outputs = outputs[-max_probes:] if max_probes > 0 else []
+    for name in outputs:
+        builder.probe(name)
+    random_stimulus(builder, steps, density, period, seed)
+    builder.done()
+    return builder
+
+
+# Command-line controller.
+if __name__ == '__main__':
+    import argparse  # Used to parse the command-line options
+
+    parser = argparse.ArgumentParser(
+        description='Writes a synthetic netlist to standard output.')
+    parser.add_argument('kind', choices=sorted(GENERATORS.keys()))
+    parser.add_argument('size', type=int,
+                        help='circuit width, or gate count for dag')
+    parser.add_argument('--steps', type=int, default=8,
+                        help='number of input change times (default: 8)')
+    parser.add_argument('--density', type=float, default=0.5,
+                        help='probability that an input changes at each '
+                        'time (default: 0.5)')
+    parser.add_argument('--period', type=int, default=1000,
+                        help='time between input changes (default: 1000)')
+    parser.add_argument('--max-probes', type=int, default=None,
+                        help='largest number of outputs to probe')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random stimulus seed (default: 0)')
+    args = parser.parse_args()
+    builder = generate(sys.stdout, args.kind, args.size, args.steps,
+                       args.density, args.period, args.max_probes, args.seed)
+    sys.stderr.write(str(builder.gate_count) + ' gates\n')
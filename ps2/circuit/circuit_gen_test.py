@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import unittest
+import random
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from circuit import LevelizedSimulation, Simulation
+from circuit_gen import *
+
+
+class CircuitGenTest(unittest.TestCase):
+    def _build(self, generator, size):
+        # Returns a levelized simulation of a generated circuit, and the names
+        # of its outputs.
+        netlist = StringIO()
+        builder = NetlistBuilder(netlist)
+        outputs = generator(builder, size)
+        builder.done()
+        netlist.seek(0)
+        sim = Simulation.from_file(netlist)
+        return LevelizedSimulation(sim.circuit), outputs
+
+    def _number(self, engine, names):
+        return sum([engine.output(names[i]) << i for i in range(len(names))])
+
+    def _bits(self, prefix, value, width):
+        return dict([(prefix + str(i), (value >> i) & 1)
+                     for i in range(width)])
+
+    def testSorter(self):
+        engine, outputs = self._build(sorter, 16)
+        generator = random.Random(1)
+        for trial in range(20):
+            inputs = self._bits('i', generator.getrandbits(16), 16)
+            engine.run(inputs)
+            values = [engine.output(name) for name in outputs]
+            self.assertEqual(sorted(inputs.values()), values)
+
+    def testSorterWidth(self):
+        self.assertRaises(ValueError, sorter, NetlistBuilder(StringIO()), 12)
+
+    def testAdders(self):
+        for generator_function in [adder, prefix_adder]:
+            engine, outputs = self._build(generator_function, 8)
+            generator = random.Random(2)
+            for trial in range(20):
+                a = generator.getrandbits(8)
+                b = generator.getrandbits(8)
+                inputs = self._bits('a', a, 8)
+                inputs.update(self._bits('b', b, 8))
+                engine.run(inputs)
+                self.assertEqual(a + b, self._number(engine, outputs))
+
+    def testMultiplier(self):
+        engine, outputs = self._build(multiplier, 5)
+        for a in range(32):
+            for b in range(0, 32, 7):
+                inputs = self._bits('a', a, 5)
+                inputs.update(self._bits('b', b, 5))
+                engine.run(inputs)
+                self.assertEqual(a * b, self._number(engine, outputs))
+
+    def testRandomDag(self):
+        netlist = StringIO()
+        builder = NetlistBuilder(netlist)
+        outputs = random_dag(builder, 500, 10, window=50, seed=3)
+        builder.done()
+        netlist.seek(0)
+        circuit = Simulation.from_file(netlist).circuit
+        self.assertEqual(500, len(circuit.gates))
+        self.assertEqual(500, len(circuit.topological_order()))
+        for name in outputs:
+            self.assertFalse(circuit.gates[name].has_output_connected())
+
+    def testGenerate(self):
+        netlists = []
+        for trial in range(2):
+            netlist = StringIO()
+            generate(netlist, 'dag', 300, steps=4, density=0.75, max_probes=5)
+            netlists.append(netlist.getvalue())
+        self.assertEqual(netlists[0], netlists[1])
+
+        sim = Simulation.from_file(StringIO(netlists[0]))
+        self.assertEqual(5, len([gate for gate in sim.circuit.gates.values()
+                                 if gate.probed]))
+        self.assertTrue(len(sim.in_transitions) > 0)
+        sim.run()
+
+    def testGenerateDensity(self):
+        netlist = StringIO()
+        generate(netlist, 'adder', 4, density=0)
+        self.assertEqual(0, len(Simulation.from_file(
+            StringIO(netlist.getvalue())).in_transitions))
+        self.assertRaises(ValueError, generate, StringIO(), 'fft', 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
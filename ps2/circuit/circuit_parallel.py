@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+
+import multiprocessing  # Used to simulate the partitions on all the cores
+import sys
+
+from circuit import Circuit, Simulation, Transition
+
+# Python 3 doesn't have xrange, and range behaves like xrange.
+if sys.version_info >= (3,):
+    xrange = range
+
+
+# Partitioned parallel simulation.
+
+# The ParallelSimulation whose partitions are simulated by the worker
+# processes. It is set before the workers are forked, so each worker builds its
+# partition from the parent's copy of the circuit.
+_worker_parallel = None
+
+
+def _serve(index, connection):
+    # Simulates a partition in a worker process, answering the messages
+    # received from the coordinator until the simulation finishes.
+    partition = _worker_parallel._partition_simulation(index)
+    while True:
+        message = connection.recv()
+        connection.send(partition.handle(message))
+        if message[0] == 'finish':
+            break
+    connection.close()
+
+
+class PartitionSimulation(Simulation):
+    """Simulation of the gates in one partition of a circuit.
+
+    The partition's circuit also has copies of the gates in other partitions
+    that drive its gates' inputs. These ghost gates are not evaluated. Their
+    outputs follow the transitions received from the partitions that own
+    them. In turn, the transitions queued for the partition's boundary gates,
+    whose outputs drive gates in other partitions, are collected so they can
+    be sent to those partitions.
+    """
+
+    def __init__(self, circuit, boundary_gates):
+        """Creates a simulation for a partition.
+
+        Args:
+            circuit: The partition's circuit, including its ghost gates.
+            boundary_gates: The gates whose transitions are sent to the other
+                partitions.
+        """
+        Simulation.__init__(self, circuit)
+        self.boundary_gates = set(boundary_gates)
+        # [time, gate name, output value] transitions of the boundary gates
+        # queued since the last window, in the order they were queued.
+        self.outgoing = []
+
+    def _schedule(self, gate, output, time):
+        # Queues a transition, and records it if the gate is a boundary gate.
+        if not Simulation._schedule(self, gate, output, time):
+            return False
+        if gate in self.boundary_gates:
+            self.outgoing.append([time, gate.name, output])
+        return True
+
+    def run_window(self, end_time, incoming):
+        """Runs the steps that happen before the end of a window.
+
+        Args:
+            end_time: The end of the window. Steps at this time are not run.
+            incoming: [time, gate name, output value] transitions of ghost
+                gates, in the order that their owners queued them.
+
+        Returns:
+            The boundary transitions queued during the window.
+        """
+        gates = self.circuit.gates
+        queue = self.queue
+        for time, gate_name, output_value in incoming:
+            queue.append(Transition(gates[gate_name], output_value, time))
+        while len(queue) > 0 and queue.min().time < end_time:
+            self.step()
+        outgoing = self.outgoing
+        self.outgoing = []
+        return outgoing
+
+    def next_time(self):
+        """The time of the next queued transition, or None if there is none."""
+        return self.queue.min().time if len(self.queue) > 0 else None
+
+    def handle(self, message):
+        """Carries out a request from the coordinator.
+
+        Args:
+            message: One of:
+                * ['start'] - queues the initial transitions, and returns the
+                  next queued time
+                * ['window', end_time, incoming] - runs a window, and returns
+                  the outgoing transitions and the next queued time
+                * ['finish'] - returns the probe results, sorted
+        """
+        if message[0] == 'start':
+            self.start()
+            return self.next_time()
+        if message[0] == 'window':
+            outgoing = self.run_window(message[1], message[2])
+            return [outgoing, self.next_time()]
+        if message[0] == 'finish':
+            self.probes.sort()
+            return self.probes
+        raise ValueError('Unknown message ' + message[0])
+
+
+class ParallelSimulation:
+    """Conservative parallel simulation of a circuit split into partitions.
+
+    Each partition is simulated in its own process. The gates are assigned to
+    partitions so that few connections cross partitions. The lookahead is the
+    smallest delay of a gate whose output drives another partition. A
+    transition queued at time t therefore reaches another partition at time
+    t + lookahead or later. The partitions advance in windows that start at
+    the earliest queued transition and last lookahead. At the end of each
+    window, the coordinator forwards the boundary transitions queued during
+    the window to the partitions that hold ghost copies of those gates.
+
+    Ghost gates replay the exact sequence of transitions queued for the gates
+    they copy, so the probe results are the same as those of Simulation.
+    Input gates are never evaluated. Each partition has its own copy of the
+    input gates it reads, and gets those gates' initial transitions.
+
+    The windows are synchronized by exchanging messages, so circuits whose
+    boundary gates have short delays relative to the simulated time need
+    many windows. A circuit whose lookahead is 0 is simulated sequentially.
+    """
+
+    def __init__(self, simulation, partitions=None, fork=True):
+        """Creates a parallel simulation of a simulation that has not run.
+
+        Args:
+            simulation: The Simulation that supplies the circuit, its initial
+                state, and the initial transitions.
+            partitions: The number of partitions. Defaults to the number of
+                CPUs.
+            fork: If False, the partitions are simulated one after the other
+                in the current process. This is also the case on platforms
+                that cannot fork processes.
+        """
+        self.simulation = simulation
+        self.circuit = simulation.circuit
+        if partitions is None:
+            partitions = multiprocessing.cpu_count()
+        self.fork = fork
+
+        numbers = ParallelSimulation.partition(self.circuit, partitions)
+        # The names of the non-input gates in each partition, in topological
+        # order.
+        self.partitions = [[] for i in xrange(partitions)]
+        for gate in self.circuit.analysis().order:
+            if gate.name in numbers:
+                self.partitions[numbers[gate.name]].append(gate.name)
+        # The partitions that hold ghost copies of each gate, by gate name.
+        # Input gates are copied into each partition that reads them, and
+        # belong to the partition of their first reader.
+        self.ghost_partitions = {}
+        self.input_partitions = {}
+        self.lookahead = None
+        for gate in self.circuit.gates.values():
+            if gate.name in numbers:
+                owner = numbers[gate.name]
+            else:
+                owner = (numbers[gate.out_gates[0].name]
+                         if gate.has_output_connected() else 0)
+                self.input_partitions[gate.name] = owner
+            readers = set([numbers[out_gate.name]
+                           for out_gate in gate.out_gates])
+            readers.discard(owner)
+            if len(readers) == 0:
+                continue
+            self.ghost_partitions[gate.name] = sorted(readers)
+            if gate.name in numbers:
+                delay = gate.gate_type.delay
+                if self.lookahead is None or delay < self.lookahead:
+                    self.lookahead = delay
+        self.probes = None
+
+    @staticmethod
+    def partition(circuit, count):
+        """Assigns a circuit's gates to partitions with few connections
+        between them.
+
+        The gates are split into equal ranges of a topological order, so the
+        partitions start out as slices of the circuit from its inputs to its
+        outputs. Then each gate moves to the partition that holds most of its
+        neighbors, as long as that partition does not grow more than 10% over
+        the average size.
+
+        Args:
+            circuit: The circuit to be split.
+            count: The number of partitions.
+
+        Returns:
+            A hash mapping the names of all the gates, except for input gates,
+            to partition numbers from 0 to count - 1.
+        """
+        gates = [gate for gate in circuit.analysis().order
+                 if gate.has_inputs_connected()]
+        size = max(1, (len(gates) + count - 1) // count)
+        limit = size + size // 10 + 1
+        numbers = {}
+        sizes = [0] * count
+        for i in xrange(len(gates)):
+            numbers[gates[i].name] = i // size
+            sizes[i // size] += 1
+
+        for gate in gates:
+            current = numbers[gate.name]
+            neighbor_counts = {}
+            for neighbor in gate.in_gates + gate.out_gates:
+                number = numbers.get(neighbor.name)
+                if number is not None:
+                    neighbor_counts[number] = neighbor_counts.get(number, 0) + 1
+            best = current
+            for number in sorted(neighbor_counts.keys()):
+                if (neighbor_counts[number] >
+                        neighbor_counts.get(best, 0) and
+                        sizes[number] < limit):
+                    best = number
+            if best != current and sizes[current] > 1:
+                numbers[gate.name] = best
+                sizes[current] -= 1
+                sizes[best] += 1
+        return numbers
+
+    def run(self):
+        """Runs the simulation to completion.
+
+        Returns:
+            The probe results, in the same format as Simulation.probes. They
+            are also stored in the simulation's probes.
+        """
+        if self.lookahead == 0 or len(self.partitions) == 1:
+            self.simulation.run()
+            self.probes = self.simulation.probes
+            return self.probes
+
+        global _worker_parallel
+        _worker_parallel = self
+        workers = []
+        try:
+            for index in xrange(len(self.partitions)):
+                workers.append(self._start_worker(index))
+            self.probes = self._coordinate(workers)
+        finally:
+            for worker in workers:
+                worker.close()
+            _worker_parallel = None
+        self.simulation.probes = self.probes
+        return self.probes
+
+    def _coordinate(self, workers):
+        # Runs windows on the workers until no transitions are left, and
+        # returns the merged probe results.
+        next_times = self._call_all(workers, [['start']] * len(workers))
+        pending = [[] for worker in workers]
+        while True:
+            times = [time for time in next_times if time is not None]
+            for incoming in pending:
+                times.extend([transition[0] for transition in incoming])
+            if len(times) == 0:
+                break
+            if self.lookahead is None:
+                end_time = float('inf')
+            else:
+                end_time = min(times) + self.lookahead
+            # Partitions without transitions in the window sit it out.
+            active = [index for index in xrange(len(workers))
+                      if len(pending[index]) > 0 or
+                      (next_times[index] is not None and
+                       next_times[index] < end_time)]
+            replies = self._call_all(
+                [workers[index] for index in active],
+                [['window', end_time, pending[index]] for index in active])
+            for index in active:
+                pending[index] = []
+            for i in xrange(len(active)):
+                outgoing, next_times[active[i]] = replies[i]
+                for transition in outgoing:
+                    for number in self.ghost_partitions[transition[1]]:
+                        pending[number].append(transition)
+
+        probes = []
+        for partition_probes in self._call_all(workers,
+                                               [['finish']] * len(workers)):
+            probes.extend(partition_probes)
+        probes.sort()
+        return probes
+
+    def _call_all(self, workers, messages):
+        # Sends a message to each worker, then collects their replies, so that
+        # the workers handle their messages at the same time.
+        for index in xrange(len(workers)):
+            workers[index].send(messages[index])
+        return [worker.receive() for worker in workers]
+
+    def _start_worker(self, index):
+        # A handle to the worker that simulates a partition.
+        if not self.fork or not self._can_fork():
+            return _LocalWorker(self._partition_simulation(index))
+        if hasattr(multiprocessing, 'get_context'):
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing
+        connection, worker_connection = context.Pipe()
+        process = context.Process(target=_serve,
+                                  args=(index, worker_connection))
+        process.daemon = True
+        process.start()
+        worker_connection.close()
+        return _ProcessWorker(process, connection)
+
+    def _can_fork(self):
+        # True if worker processes can be forked from this process.
+        if hasattr(multiprocessing, 'get_all_start_methods'):
+            return 'fork' in multiprocessing.get_all_start_methods()
+        return sys.platform != 'win32'
+
+    def _partition_simulation(self, index):
+        # Builds the simulation of a partition: its gates, the ghost copies of
+        # the gates driving them from other partitions, and its copies of
+        # input gates, with the same state as in the parent circuit.
+        gates = self.circuit.gates
+        circuit = Circuit()
+        circuit.truth_tables = self.circuit.truth_tables
+        circuit.gate_types = self.circuit.gate_types
+        names = self.partitions[index]
+        owned_names = set(names)
+        ghost_names = set()
+        for name in names:
+            for in_gate in gates[name].in_gates:
+                ghost_names.add(in_gate.name)
+        for name, number in self.input_partitions.items():
+            if number == index:
+                ghost_names.add(name)
+        ghost_names.difference_update(owned_names)
+
+        boundary_gates = []
+        for name in sorted(ghost_names) + names:
+            gate = gates[name]
+            if name in owned_names:
+                copy = circuit.add_gate(name, gate.gate_type.name,
+                                        [in_gate.name
+                                         for in_gate in gate.in_gates])
+                if name in self.ghost_partitions:
+                    boundary_gates.append(copy)
+            else:
+                # Ghosts and input gates have no inputs, so they are never
+                # evaluated.
+                copy = circuit.add_gate(name, gate.gate_type.name, [])
+            copy.output = gate.output
+            copy.scheduled_output = gate.scheduled_output
+            copy.scheduled_time = gate.scheduled_time
+            if gate.probed and (name in owned_names or
+                                self.input_partitions.get(name) == index):
+                copy.probe()
+
+        simulation = PartitionSimulation(circuit, boundary_gates)
+        for in_transition in self.simulation.in_transitions:
+            if in_transition[1] in circuit.gates:
+                simulation.add_transition(in_transition[1], in_transition[2],
+                                          in_transition[0])
+        return simulation
+
+
+class _LocalWorker:
+    # Simulates a partition in the current process.
+
+    def __init__(self, partition):
+        self.partition = partition
+        self.reply = None
+
+    def send(self, message):
+        self.reply = self.partition.handle(message)
+
+    def receive(self):
+        return self.reply
+
+    def close(self):
+        pass
+
+
+class _ProcessWorker:
+    # Simulates a partition in a worker process.
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+
+    def send(self, message):
+        self.connection.send(message)
+
+    def receive(self):
+        return self.connection.recv()
+
+    def close(self):
+        self.connection.close()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from circuit_parallel import *
+
+
+class ParallelSimulationTest(unittest.TestCase):
+    def _simulation(self, name):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   name + '.in')
+        with open(in_filename) as in_file:
+            return Simulation.from_file(in_file)
+
+    def _sequential_probes(self, name):
+        sim = self._simulation(name)
+        sim.run()
+        return sim.probes
+
+    def testPartition(self):
+        circuit = self._simulation('7sort128').circuit
+        numbers = ParallelSimulation.partition(circuit, 4)
+        gates = [gate for gate in circuit.gates.values()
+                 if gate.has_inputs_connected()]
+        self.assertEqual(len(gates), len(numbers))
+        sizes = [0] * 4
+        for gate in gates:
+            sizes[numbers[gate.name]] += 1
+        average = len(gates) // 4
+        for size in sizes:
+            self.assertTrue(size > 0)
+            self.assertTrue(size <= average + average // 10 + 2)
+
+    def testSameProbes(self):
+        for name in ['4sort', '6correctness', '8multiplier', '7sort128']:
+            expected = self._sequential_probes(name)
+            for fork in [False, True]:
+                parallel = ParallelSimulation(self._simulation(name), 3, fork)
+                self.assertTrue(parallel.lookahead > 0)
+                self.assertEqual(expected, parallel.run())
+
+    def testZeroLookahead(self):
+        netlist = ('table buf 0 1\ntype in buf 0\ntype wire buf 0\n'
+                   'type slow buf 3\ngate a in\ngate b slow a\n'
+                   'gate c wire b\ngate d slow c\ngate e wire d\n'
+                   'probe e\nflip a 1 5\nflip a 0 7\ndone\n')
+        sim = Simulation.from_file(StringIO(netlist))
+        sim.run()
+        parallel = ParallelSimulation(Simulation.from_file(StringIO(netlist)),
+                                      2)
+        self.assertEqual(0, parallel.lookahead)
+        self.assertEqual(sim.probes, parallel.run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+import multiprocessing  # Used to run simulations on all the cores
+import sys
+
+from circuit import Simulation, VALUE_NAMES, parse_value
+
+
+# Parallel stimulus sweeps.
+
+# The circuit used by the worker processes. It is set before the workers are
+# forked, so they share the parent's copy of the circuit instead of parsing
+# the netlist again or receiving a pickled copy.
+_worker_circuit = None
+
+
+def _simulate(stimulus):
+    # Simulates one stimulus set on the worker's circuit.
+    #
+    # Returns:
+    #     The simulation's probe results.
+    circuit = _worker_circuit
+    # Restores the circuit's initial_output, which may be X.
+    circuit.reset()
+    sim = Simulation(circuit)
+    for gate_name, output_value, output_time in stimulus:
+        sim.add_transition(gate_name, output_value, output_time)
+    sim.run()
+    return sim.probes
+
+
+class StimulusSweep:
+    """Simulates many independent stimulus sets on the same circuit.
+
+    The circuit is built once. The stimulus sets are spread over a pool of
+    worker processes, which are forked from the current process and share its
+    copy of the circuit.
+    """
+
+    def __init__(self, circuit, processes=None):
+        """Creates a sweep for a completely built circuit.
+
+        Args:
+            circuit: The circuit that all the stimulus sets are applied to.
+            processes: The number of worker processes. Defaults to the number
+                of CPUs. A sweep with 1 process runs in the current process.
+        """
+        self.circuit = circuit
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+
+    def run(self, stimulus_sets):
+        """Simulates each stimulus set, starting from a reset circuit.
+
+        Args:
+            stimulus_sets: A list of stimulus sets. Each set is a list of
+                [gate name, output value, output time] transitions, matching
+                the flip commands in the simulator's input.
+
+        Returns:
+            A list with the probe results (as in Simulation.probes) for each
+            stimulus set, in the same order as the stimulus sets.
+        """
+        global _worker_circuit
+        _worker_circuit = self.circuit
+        try:
+            if self.processes <= 1 or not self._can_fork():
+                return [_simulate(stimulus) for stimulus in stimulus_sets]
+            pool = self._fork_pool()
+            try:
+                chunk_size = max(1, len(stimulus_sets) // (4 * self.processes))
+                return pool.map(_simulate, stimulus_sets, chunk_size)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            _worker_circuit = None
+
+    def _can_fork(self):
+        # True if worker processes can be forked from this process.
+        if hasattr(multiprocessing, 'get_all_start_methods'):
+            return 'fork' in multiprocessing.get_all_start_methods()
+        return sys.platform != 'win32'
+
+    def _fork_pool(self):
+        # A pool of worker processes forked from this process.
+        if hasattr(multiprocessing, 'get_context'):
+            return multiprocessing.get_context('fork').Pool(self.processes)
+        return multiprocessing.Pool(self.processes)
+
+    @staticmethod
+    def stimulus_from_file(file):
+        """Reads a stimulus set from the flip commands in a file.
+
+        Other commands are ignored, so a stimulus file can be a complete
+        simulator input, or just a list of flip commands.
+
+        Args:
+            file: A File object supplying the input.
+
+        Returns:
+            A list of [gate name, output value, output time] transitions.
+        """
+        stimulus = []
+        for line in file:
+            command = line.split()
+            if len(command) < 1:
+                continue
+            if command[0] == 'flip':
+                if len(command) != 4:
+                    raise ValueError('Invalid number of arguments for flip '
+                                     'command')
+                stimulus.append([command[1], parse_value(command[2]),
+                                 int(command[3])])
+            elif command[0] == 'done':
+                break
+        return stimulus
+
+
+# Command-line controller.
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        sys.stderr.write('Usage: ' + sys.argv[0] +
+                         ' circuit.in stimulus1.in [stimulus2.in ...]\n'
+                         'Writes the probe results for each stimulus file to '
+                         '<stimulus file>.out\n')
+        sys.exit(1)
+    with open(sys.argv[1]) as in_file:
+        circuit = Simulation.from_file(in_file).circuit
+    stimulus_sets = []
+    for stimulus_filename in sys.argv[2:]:
+        with open(stimulus_filename) as stimulus_file:
+            stimulus_sets.append(StimulusSweep.stimulus_from_file(stimulus_file))
+
+    results = StimulusSweep(circuit).run(stimulus_sets)
+    for i in range(len(results)):
+        with open(sys.argv[2 + i] + '.out', 'w') as out_file:
+            for probe in results[i]:
+                out_file.write(' '.join([str(probe[0]), probe[1],
+                                         VALUE_NAMES[probe[2]]]))
+                out_file.write('\n')
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import unittest
+import os
+from circuit import X
+from circuit_sweep import *
+
+
+class StimulusSweepTest(unittest.TestCase):
+    def setUp(self):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   '8multiplier.in')
+        with open(in_filename) as in_file:
+            self.circuit = Simulation.from_file(in_file).circuit
+        self.stimulus_sets = []
+        for a in range(4):
+            for b in range(4):
+                self.stimulus_sets.append(
+                    [['a0', a & 1, 10], ['a1', a >> 1, 10],
+                     ['b0', b & 1, 20], ['b1', b >> 1, 20]])
+
+    def _product(self, probes):
+        outputs = {'c0': 0, 'c1': 0, 'c2': 0, 'c3': 0}
+        for time, gate_name, value in probes:
+            outputs[gate_name] = value
+        return (outputs['c0'] + 2 * outputs['c1'] + 4 * outputs['c2'] +
+                8 * outputs['c3'])
+
+    def testSequential(self):
+        results = StimulusSweep(self.circuit, 1).run(self.stimulus_sets)
+        for a in range(4):
+            for b in range(4):
+                self.assertEqual(a * b, self._product(results[a * 4 + b]))
+
+    def testParallel(self):
+        sequential = StimulusSweep(self.circuit, 1).run(self.stimulus_sets)
+        parallel = StimulusSweep(self.circuit, 3).run(self.stimulus_sets)
+        self.assertEqual(sequential, parallel)
+
+    def testUnknownInitialValues(self):
+        self.circuit.reset(X)
+        stimulus_sets = [[['a0', 1, 10], ['b0', 1, 20]], [['a0', 0, 10]]]
+        # Each set starts from unknown outputs, so a0 = 0 settles c0 and c3
+        # even though a 0-initialized circuit would not change.
+        expected = [[[33, 'c0', 1]], [[23, 'c0', 0], [25, 'c3', 0]]]
+        self.assertEqual(expected,
+                         StimulusSweep(self.circuit, 1).run(stimulus_sets))
+        self.assertEqual(expected,
+                         StimulusSweep(self.circuit, 2).run(stimulus_sets))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,19 @@
 
 import unittest
 import sys
+import io
+import shutil
+import tempfile
 import glob
+import random
 import re
 from circuit import *
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 class CircuitTest(unittest.TestCase):
     def setUp(self):
         dir = os.path.dirname(__file__)
@@ -37,7 +46,566 @@ class CircuitTest(unittest.TestCase):
                     else: 
                         print 'Failed'
                     self.assertTrue(same)
-    
+
+    def _small_in_files(self):
+        # The test inputs that have gold outputs short enough to be checked
+        # several times per test run. Larger outputs are left to
+        # testCorrectness.
+        in_files = []
+        for in_filename in self._in_files:
+            gold_filename = re.sub('\.in$', '.gold', in_filename)
+            if (os.path.exists(gold_filename) and
+                    os.path.getsize(gold_filename) <= 1000000):
+                in_files.append(in_filename)
+        return in_files
+
+    def testStreamingProbes(self):
+        for in_filename in self._small_in_files():
+            with open(in_filename) as in_file:
+                sim = Simulation.from_file(in_file)
+            out_file = StringIO()
+            sim.stream_probes_to(out_file)
+            sim.run()
+            self.assertEqual([], sim.probes)
+
+            gold_filename = re.sub('\.in$', '.gold', in_filename)
+            with open(gold_filename) as gold_file:
+                self.assertEqual(gold_file.read(), out_file.getvalue())
+
+    def _jsonp_data(self, out_file):
+        text = out_file.getvalue()
+        self.assertTrue(text.startswith('onJsonp('))
+        self.assertTrue(text.endswith(');\n'))
+        return json.loads(text[len('onJsonp('):-len(');\n')])
+
+    def testStreamingJsonp(self):
+        for name in ['4sort.in', '8multiplier.in']:
+            in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                       name)
+            with open(in_filename) as in_file:
+                sim = Simulation.from_file(in_file).layout_from_file(in_file)
+            sim.probe_all_gates()
+            sim.run()
+            sim.undo_probe_all_gates()
+            out_file = StringIO()
+            sim.jsonp_to_file(out_file)
+            expected = self._jsonp_data(out_file)
+
+            with open(in_filename) as in_file:
+                sim = Simulation.from_file(in_file).layout_from_file(in_file)
+            out_file = StringIO()
+            chunk_size = JsonpTraceWriter.CHUNK_SIZE
+            JsonpTraceWriter.CHUNK_SIZE = 5
+            try:
+                sim.stream_jsonp_to(out_file)
+                sim.probe_all_gates()
+                sim.run()
+                sim.undo_probe_all_gates()
+                sim.close_jsonp()
+            finally:
+                JsonpTraceWriter.CHUNK_SIZE = chunk_size
+            self.assertEqual([], sim.probes)
+            data = self._jsonp_data(out_file)
+            self.assertEqual(expected['circuit'], data['circuit'])
+            self.assertEqual(expected['layout'], data['layout'])
+
+            gate_names = [gate['id'] for gate in data['circuit']['gates']]
+            trace = []
+            trace_time = 0
+            self.assertTrue(len(data['trace']['chunks']) > 1)
+            for chunk in data['trace']['chunks']:
+                for i in range(len(chunk['dt'])):
+                    trace_time += chunk['dt'][i]
+                    trace.append([trace_time, gate_names[chunk['gate'][i]],
+                                  chunk['value'][i]])
+            self.assertEqual(expected['trace'], trace)
+
+    def _multiplier_sim(self):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   '8multiplier.in')
+        with open(in_filename) as in_file:
+            return Simulation.from_file(in_file)
+
+    def testProbeMatching(self):
+        sim = self._multiplier_sim()
+        self.assertEqual(3, sim.probe_matching('a?b?'))
+        self.assertEqual(2, sim.probe_matching(re.compile('^b[01]$')))
+        self.assertEqual(['a0b1', 'a1b0', 'a1b1', 'b0', 'b1', 'c0', 'c1', 'c2',
+                          'c3'],
+                         sorted([gate.name for gate in
+                                 sim.circuit.gates.values() if gate.probed]))
+        sim.run()
+        self.assertTrue('b1' in [probe[1] for probe in sim.probes])
+        sim.undo_probe_all_gates()
+        self.assertEqual(['c0', 'c1', 'c2', 'c3'],
+                         sorted([gate.name for gate in
+                                 sim.circuit.gates.values() if gate.probed]))
+
+    def testProbeFilter(self):
+        sim = self._multiplier_sim()
+        sim.run()
+        all_probes = sim.probes
+
+        sim = self._multiplier_sim()
+        sim.filter_probes(56, 86)
+        sim.run()
+        self.assertEqual([probe for probe in all_probes
+                          if 56 <= probe[0] <= 86], sim.probes)
+
+        sim = self._multiplier_sim()
+        sim.filter_probes(every=2)
+        sim.run()
+        expected = []
+        for gate_name in ['c0', 'c1', 'c2', 'c3']:
+            expected.extend([probe for probe in all_probes
+                             if probe[1] == gate_name][::2])
+        self.assertEqual(sorted(expected), sim.probes)
+        self.assertRaises(ValueError, sim.filter_probes, every=0)
+
+    def testFromFileWithoutDone(self):
+        in_file = StringIO('table eq 0 1\ntype in eq 0\ngate a in\n')
+        self.assertRaises(ValueError, Simulation.from_file, in_file)
+
+    def testSupersededTransitionsDropped(self):
+        class CountingQueue(HeapPriorityQueue):
+            def __init__(self):
+                HeapPriorityQueue.__init__(self)
+                self.appends = 0
+            def append(self, key):
+                self.appends += 1
+                HeapPriorityQueue.append(self, key)
+
+        sim = Simulation.from_file(StringIO(
+            'table eq 0 1\ntable and2 0 0 0 1\ntype in eq 0\n'
+            'type and2 and2 5\ngate a in\ngate b in\ngate ab and2 a b\n'
+            'probe ab\nflip a 1 0\nflip a 0 10\nflip a 1 20\nflip b 0 30\n'
+            'done\n'))
+        sim.queue = CountingQueue()
+        sim.run()
+        # Only the flips that change a are queued; ab and b never change.
+        self.assertEqual(3, sim.queue.appends)
+        self.assertEqual([], sim.probes)
+
+    def testFanOutEvaluatedOncePerSlice(self):
+        sim = Simulation.from_file(StringIO(
+            'table eq 0 1\ntable and2 0 0 0 1\ntype in eq 0\n'
+            'type and2 and2 5\ngate a in\ngate b in\ngate ab and2 a b\n'
+            'probe ab\nflip a 1 10\nflip b 1 10\ndone\n'))
+        stats = sim.enable_stats()
+        sim.run()
+        # Both of ab's inputs change in the same slice, so ab is evaluated
+        # once and queues a single transition.
+        self.assertEqual(1, stats.gate_evaluations)
+        self.assertEqual(3, stats.events_scheduled)
+        self.assertEqual(0, stats.events_dropped)
+        self.assertEqual([[15, 'ab', 1]], sim.probes)
+
+    def testStats(self):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   '7sort128.in')
+        with open(in_filename) as in_file:
+            sim = Simulation.from_file(in_file)
+        stats = sim.enable_stats()
+        sim.run()
+        # Every queued transition is eventually popped.
+        self.assertEqual(stats.events_scheduled,
+                         stats.events_applied + stats.events_discarded)
+        # Every evaluation or initial transition is either queued or dropped.
+        self.assertEqual(stats.gate_evaluations + len(sim.in_transitions),
+                         stats.events_scheduled + stats.events_dropped)
+        self.assertEqual(stats.steps, sum(stats.slice_sizes.values()))
+        self.assertEqual(stats.events_applied,
+                         sum([size * count for size, count
+                              in stats.slice_sizes.items()]))
+        self.assertTrue(stats.queue_high_water > 0)
+        self.assertTrue('parse' in stats.phase_seconds)
+        self.assertTrue('run' in stats.phase_seconds)
+        stats_file = StringIO()
+        stats.to_file(stats_file)
+        self.assertEqual(stats.steps,
+                         json.loads(stats_file.getvalue())['steps'])
+
+    def _gold_lines(self, in_filename):
+        gold_filename = re.sub('\.in$', '.gold', in_filename)
+        with open(gold_filename) as gold_file:
+            return [line.strip() for line in gold_file]
+
+    def testCheckpointResume(self):
+        for in_filename in self._small_in_files():
+            with open(in_filename) as in_file:
+                sim = Simulation.from_file(in_file)
+            sim.start()
+            for i in range(5):
+                if len(sim.queue) > 0:
+                    sim.step()
+            checkpoint_file = io.BytesIO()
+            sim.checkpoint().to_file(checkpoint_file)
+
+            with open(in_filename) as in_file:
+                resumed_sim = Simulation.from_file(in_file)
+            checkpoint_file.seek(0)
+            resumed_sim.restore(Checkpoint.from_file(checkpoint_file))
+            self.assertEqual(sim.time, resumed_sim.time)
+            resumed_sim.run()
+            self.assertEqual(self._gold_lines(in_filename),
+                             resumed_sim.outputs_to_line_list())
+
+    def testPeriodicCheckpoints(self):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   '7sort128.in')
+        checkpoint_dir = tempfile.mkdtemp()
+        checkpoint_path = os.path.join(checkpoint_dir, 'sort.ckpt')
+        try:
+            with open(in_filename) as in_file:
+                sim = Simulation.from_file(in_file)
+            sim.checkpoint_to(checkpoint_path, 40)
+            sim.run()
+            self.assertEqual(['sort.ckpt'], os.listdir(checkpoint_dir))
+
+            with open(in_filename) as in_file:
+                resumed_sim = Simulation.from_file(in_file)
+            with open(checkpoint_path, 'rb') as checkpoint_file:
+                resumed_sim.restore(Checkpoint.from_file(checkpoint_file))
+            self.assertTrue(resumed_sim.time > 0)
+            resumed_sim.run()
+            self.assertEqual(self._gold_lines(in_filename),
+                             resumed_sim.outputs_to_line_list())
+        finally:
+            shutil.rmtree(checkpoint_dir)
+
+    def testPeriodicCheckpointsInWindows(self):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   '4sort.in')
+        checkpoint_dir = tempfile.mkdtemp()
+        checkpoint_path = os.path.join(checkpoint_dir, 'sort.ckpt')
+        try:
+            with open(in_filename) as in_file:
+                sim = Simulation.from_file(in_file)
+            sim.checkpoint_to(checkpoint_path, 5)
+            # Each window takes at most one step.
+            while len(sim.queue) > 0 or not sim.started:
+                sim.run_for(1)
+            self.assertEqual(['sort.ckpt'], os.listdir(checkpoint_dir))
+            with open(checkpoint_path, 'rb') as checkpoint_file:
+                self.assertTrue(Checkpoint.from_file(checkpoint_file).time > 0)
+        finally:
+            shutil.rmtree(checkpoint_dir)
+
+    def testSampledCheckpointResume(self):
+        netlist = ('table buf 0 1\ntype in buf 0\ntype buf buf 3\n'
+                   'gate a in\ngate b buf a\nprobe a\nprobe b\n' +
+                   ''.join(['flip a %d %d\n' % (i % 2, 10 * i + 10)
+                            for i in range(20)]) + 'done\n')
+        sim = Simulation.from_file(StringIO(netlist))
+        sim.filter_probes(None, None, 3)
+        sim.run()
+
+        sim_part = Simulation.from_file(StringIO(netlist))
+        sim_part.filter_probes(None, None, 3)
+        sim_part.start()
+        for i in range(7):
+            sim_part.step()
+        checkpoint_file = io.BytesIO()
+        sim_part.checkpoint().to_file(checkpoint_file)
+        checkpoint_file.seek(0)
+
+        resumed_sim = Simulation.from_file(StringIO(netlist))
+        resumed_sim.filter_probes(None, None, 3)
+        resumed_sim.restore(Checkpoint.from_file(checkpoint_file))
+        resumed_sim.run()
+        self.assertEqual(sim.probes, resumed_sim.probes)
+
+    def testCheckpointOtherCircuit(self):
+        in_filenames = [os.path.join(os.path.dirname(__file__), 'tests', name)
+                        for name in ['4sort.in', '6correctness.in']]
+        sims = []
+        for in_filename in in_filenames:
+            with open(in_filename) as in_file:
+                sims.append(Simulation.from_file(in_file))
+        checkpoint = sims[0].checkpoint()
+        self.assertRaises(ValueError, sims[1].restore, checkpoint)
+        self.assertRaises(ValueError, Checkpoint.from_file,
+                          io.BytesIO(b'CKPT'))
+
+    def testRunUntil(self):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   '7sort128.in')
+        with open(in_filename) as in_file:
+            sim = Simulation.from_file(in_file)
+        end_time = 0
+        while len(sim.queue) > 0 or not sim.started:
+            end_time += 1000
+            sim.run_until(end_time)
+            self.assertEqual(end_time, sim.time)
+            if len(sim.queue) > 0:
+                self.assertTrue(sim.queue.min().time > end_time)
+            for probe in sim.probes:
+                self.assertTrue(probe[0] <= end_time)
+        sim.run_for(500)
+        self.assertEqual(end_time + 500, sim.time)
+        self.assertEqual(self._gold_lines(in_filename),
+                         sim.outputs_to_line_list())
+
+    def testInjectTransition(self):
+        sim = Simulation.from_file(StringIO(
+            'table eq 0 1\ntable and2 0 0 0 1\ntype in eq 0\n'
+            'type and2 and2 5\ngate a in\ngate b in\ngate ab and2 a b\n'
+            'probe ab\nflip a 1 0\ndone\n'))
+        sim.run_for(10)
+        self.assertEqual([], sim.probes)
+        sim.inject_transition('b', 1, 12)
+        sim.run_until(20)
+        self.assertEqual([[17, 'ab', 1]], sim.probes)
+        self.assertRaises(ValueError, sim.inject_transition, 'a', 0, 20)
+        sim.inject_transition('a', 0, 30)
+        sim.run()
+        self.assertEqual([[17, 'ab', 1], [35, 'ab', 0]], sim.probes)
+
+    def _probes_for(self, in_filename, in_transitions):
+        with open(in_filename) as in_file:
+            sim = Simulation.from_file(in_file)
+        sim.in_transitions = []
+        for output_time, gate_name, output_value in in_transitions:
+            sim.add_transition(gate_name, output_value, output_time)
+        sim.run()
+        return sim.probes
+
+    def testIncremental(self):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   '7sort128.in')
+        with open(in_filename) as in_file:
+            sim = Simulation.from_file(in_file)
+        in_transitions = sorted([in_transition[0:3]
+                                 for in_transition in sim.in_transitions])
+        incremental = IncrementalSimulation(sim.circuit, 50)
+        self.assertEqual(self._probes_for(in_filename, in_transitions),
+                         incremental.run(in_transitions))
+        full_steps = incremental.steps
+
+        # Move the last flip later, then earlier, then remove it.
+        last_time, gate_name, output_value = in_transitions[-1]
+        for edit in [[last_time + 500, gate_name, output_value],
+                     [last_time - 500, gate_name, output_value], None]:
+            edited = in_transitions[:-1] + ([edit] if edit else [])
+            self.assertEqual(self._probes_for(in_filename, edited),
+                             incremental.run(edited))
+            self.assertTrue(incremental.resumed_time is not None)
+            self.assertTrue(incremental.steps < full_steps)
+
+        # An edit before the first checkpoint simulates everything again.
+        edited = [[0, gate_name, 1 - output_value]] + in_transitions
+        self.assertEqual(self._probes_for(in_filename, edited),
+                         incremental.run(edited))
+        self.assertEqual(None, incremental.resumed_time)
+        incremental.run(edited)
+        self.assertEqual(0, incremental.steps)
+
+    def testIncrementalEditSequence(self):
+        in_filename = os.path.join(os.path.dirname(__file__), 'tests',
+                                   '4sort.in')
+        with open(in_filename) as in_file:
+            sim = Simulation.from_file(in_file)
+        in_transitions = sorted([in_transition[0:3]
+                                 for in_transition in sim.in_transitions])
+        incremental = IncrementalSimulation(sim.circuit, 1)
+
+        # Remove b's only flip, then edit after it. The last run resumes from
+        # a checkpoint taken while the removed flip was still queued.
+        edits = [[[0, 'd', 1], [45, 'a', 1], [98, 'b', 1], [104, 'c', 0],
+                  [120, 'd', 0], [132, 'c', 0]]]
+        edits.append([[0, 'd', 0]] + edits[-1][1:])
+        edits.append(edits[-1][0:2] + edits[-1][3:])
+        edits.append(edits[-1][:-1])
+        generator = random.Random(4)
+        edited = in_transitions
+        for trial in range(30):
+            edited = [list(in_transition) for in_transition in edited]
+            edit = generator.randrange(4)
+            if edit == 0 or len(edited) == 0:
+                edited.append([generator.randrange(150),
+                               generator.choice('abcd'),
+                               generator.randrange(2)])
+            elif edit == 1:
+                edited.pop(generator.randrange(len(edited)))
+            elif edit == 2:
+                edited[generator.randrange(len(edited))][0] = (
+                    generator.randrange(150))
+            else:
+                in_transition = edited[generator.randrange(len(edited))]
+                in_transition[2] = 1 - in_transition[2]
+            edits.append(edited)
+        for edited in edits:
+            self.assertEqual(self._probes_for(in_filename, edited),
+                             incremental.run(edited))
+
+    def testUnknownTruthTable(self):
+        and_table = TruthTable('and2', [0, 0, 0, 1])
+        self.assertTrue(and_table.binary)
+        self.assertEqual(0, and_table.output([0, X]))
+        self.assertEqual(X, and_table.output([1, X]))
+        self.assertEqual(X, and_table.output([Z, 1]))
+
+        # A tri-state buffer whose first input is the enable signal.
+        tri_table = TruthTable('tri', [Z, Z, 0, 1])
+        self.assertFalse(tri_table.binary)
+        self.assertEqual(1, tri_table.output([1, 1]))
+        self.assertEqual(Z, tri_table.output([0, X]))
+        self.assertEqual(X, tri_table.output([X, 1]))
+        self.assertRaises(ValueError, tri_table.word_output, [0, 0], 1)
+        for table in [and_table, tri_table]:
+            for inputs in [[a, b] for a in VALUES for b in VALUES]:
+                self.assertEqual(table._output(table.table, inputs, 0),
+                                 table.output(inputs))
+
+    def testSpecializedTruthTables(self):
+        tables = [('and', [0, 0, 0, 0, 0, 0, 0, 1]), ('nand', [1, 1, 1, 0]),
+                  ('or', [0, 1, 1, 1]), ('nor', [1, 0, 0, 0, 0, 0, 0, 0]),
+                  ('xor', [0, 1, 1, 0, 1, 0, 0, 1]), ('xnor', [1, 0, 0, 1]),
+                  ('buf', [0, 1]), ('not', [1, 0]),
+                  (None, [0, 1, 1, 1, 0, 0, 0, 1]), (None, [Z, Z, 0, 1])]
+        for function, outputs in tables:
+            table = TruthTable('t', outputs)
+            self.assertEqual(function, table.function)
+            # The specialized evaluators match the compiled lookup table.
+            gate_type = GateType('t', table, 1)
+            in_gates = [Gate('i' + str(i), gate_type)
+                        for i in range(table.input_count)]
+            inputs_list = [[]]
+            for i in range(table.input_count):
+                inputs_list = [inputs + [value] for inputs in inputs_list
+                               for value in VALUES]
+            for inputs in inputs_list:
+                for i in range(len(inputs)):
+                    in_gates[i].output = inputs[i]
+                self.assertEqual(table.output(inputs),
+                                 gate_type.evaluate(in_gates))
+            if table.binary:
+                input_words = [0x5a, 0x33, 0x0f][0:table.input_count]
+                self.assertEqual(
+                    table._table_word_output(input_words, 0xff),
+                    table.word_output(input_words, 0xff))
+
+    def _unknown_sim(self):
+        return Simulation.from_file(StringIO(
+            'table eq 0 1\ntable and2 0 0 0 1\ntable tri z z 0 1\n'
+            'type in eq 0\ntype and2 and2 2\ntype tri tri 1\n'
+            'gate a in\ngate b in\ngate c and2 a b\ngate d tri b a\n'
+            'probe c\nprobe d\n'
+            'flip a 1 10\nflip b X 20\nflip b 1 30\ndone\n'))
+
+    def testUnknownValues(self):
+        sim = self._unknown_sim()
+        sim.run()
+        self.assertEqual(['11 d z', '21 d x', '22 c x', '31 d 1', '32 c 1'],
+                         sim.outputs_to_line_list())
+        self.assertRaises(ValueError, LevelizedSimulation, sim.circuit)
+
+    def testUnknownInitialValues(self):
+        sim = self._unknown_sim()
+        sim.circuit.reset(X)
+        sim.run()
+        self.assertEqual(['31 d 1', '32 c 1'], sim.outputs_to_line_list())
+
+    def testUnknownInitialValuesZeroDelay(self):
+        circuit = self._multiplier_circuit()
+        circuit.reset(X)
+        inputs = {'a0': 1, 'a1': 1, 'b0': 1, 'b1': 0}
+        levelized = LevelizedSimulation(circuit)
+        self.assertRaises(ValueError, levelized.run, {'a0': 1})
+        levelized.run(inputs)
+        self.assertEqual(3, sum([levelized.output('c' + str(i)) << i
+                                 for i in range(4)]))
+
+        bit_parallel = BitParallelSimulation(circuit)
+        bit_parallel.add_vector(inputs)
+        bit_parallel.run()
+        bit_parallel.add_vector({'a0': 1})
+        self.assertRaises(ValueError, bit_parallel.run)
+
+    def testUnknownInitialValuesIncremental(self):
+        def unknown_probes(in_transitions):
+            sim = self._unknown_sim()
+            sim.circuit.reset(X)
+            sim.in_transitions = []
+            for output_time, gate_name, output_value in in_transitions:
+                sim.add_transition(gate_name, output_value, output_time)
+            sim.run()
+            return sim.probes
+
+        circuit = self._unknown_sim().circuit
+        circuit.reset(X)
+        incremental = IncrementalSimulation(circuit, 1)
+        # A full run, a restart from a checkpoint, then another full run.
+        edits = [[[10, 'a', 1], [20, 'b', X], [30, 'b', 1]],
+                 [[10, 'a', 1], [20, 'b', X], [40, 'b', 1]],
+                 [[5, 'b', 1], [10, 'a', 1]]]
+        resumed_times = []
+        for in_transitions in edits:
+            self.assertEqual(unknown_probes(in_transitions),
+                             incremental.run(in_transitions))
+            resumed_times.append(incremental.resumed_time)
+        self.assertEqual(None, resumed_times[0])
+        self.assertTrue(resumed_times[1] is not None)
+        self.assertEqual(None, resumed_times[2])
+
+    def _multiplier_circuit(self):
+        return self._multiplier_sim().circuit
+
+    def testAnalysis(self):
+        circuit = self._multiplier_circuit()
+        analysis = circuit.analysis()
+        self.assertTrue(analysis is circuit.analysis())
+        self.assertEqual(3, analysis.depth)
+        self.assertEqual(0, analysis.levels['b1'])
+        self.assertEqual(2, analysis.levels['c1'])
+        self.assertEqual(43, analysis.critical_path_delay)
+        self.assertEqual(['a1', 'a1b0', 'a0b1a1b0', 'c2'],
+                         analysis.critical_path())
+        self.assertEqual(['a0', 'c0'], analysis.critical_path('c0'))
+        self.assertEqual(set(['c2', 'a0b1a1b0', 'a1b1', 'a0b1', 'a1b0', 'a0',
+                              'a1', 'b0', 'b1']),
+                         analysis.fan_in_cone('c2'))
+        self.assertEqual(set(['b0', 'c0', 'a1b0', 'c1', 'a0b1a1b0', 'c2',
+                              'c3']),
+                         analysis.fan_out_cone('b0'))
+
+        circuit.add_gate('c4', 'and2', ['c3', 'c2'])
+        self.assertFalse(analysis is circuit.analysis())
+        self.assertEqual(4, circuit.analysis().depth)
+        self.assertTrue('c4' in circuit.analysis().fan_out_cone('b0'))
+
+        circuit.add_gate('c5', 'and2', ['c4'])
+        analysis = circuit.analysis()
+        self.assertEqual(0, analysis.levels['c5'])
+        circuit.connect('c5', 'c1', 1)
+        self.assertFalse(analysis is circuit.analysis())
+        self.assertEqual(5, circuit.analysis().levels['c5'])
+        self.assertTrue('c5' in circuit.analysis().fan_out_cone('c1'))
+
+    def testBitParallel(self):
+        sim = BitParallelSimulation(self._multiplier_circuit())
+        for a in range(4):
+            for b in range(4):
+                sim.add_vector({'a0': a & 1, 'a1': a >> 1,
+                                'b0': b & 1, 'b1': b >> 1})
+        sim.run()
+        for a in range(4):
+            for b in range(4):
+                outputs = sim.outputs(a * 4 + b)
+                product = (outputs['c0'] + 2 * outputs['c1'] +
+                           4 * outputs['c2'] + 8 * outputs['c3'])
+                self.assertEqual(a * b, product)
+
+    def testLevelized(self):
+        sim = LevelizedSimulation(self._multiplier_circuit())
+        for a in range(4):
+            for b in range(4):
+                sim.run({'a0': a & 1, 'a1': a >> 1, 'b0': b & 1, 'b1': b >> 1})
+                outputs = sim.outputs()
+                product = (outputs['c0'] + 2 * outputs['c1'] +
+                           4 * outputs['c2'] + 8 * outputs['c3'])
+                self.assertEqual(a * b, product)
+
 if __name__ == '__main__':
     unittest.main()
 
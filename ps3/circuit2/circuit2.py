@@ -1,10 +1,17 @@
 #!/usr/bin/env python
 
+import array  # Used to store the sweep line events compactly
+import bisect  # Used by SortedArrayRangeIndex and the Fenwick tree count
 import json  # Used when TRACE=jsonp
 import os  # Used to get the TRACE environment variable
 import sys  # Used to smooth over the range / xrange issue.
 from lecture6_code.avl import SizeAVL
 
+try:
+    import numpy  # Used by count_method='numpy'; optional.
+except ImportError:
+    numpy = None
+
 # Python 3 doesn't have xrange, and range behaves like xrange.
 if sys.version_info >= (3,):
     xrange = range
@@ -196,6 +203,57 @@ class AVLRangeIndex(object):
         return self.data.count(first_key, last_key)
 
 
+class SortedArrayRangeIndex(object):
+    """Sorted array-based range index implementation.
+  
+  The keys are KeyWirePairs, kept in sorted order, so queries use binary
+  search. Adding or removing a key shifts the keys after it, which is cheap
+  for moderately sized indexes."""
+
+    def __init__(self):
+        """Initially empty range index."""
+        self.data = []
+        # The (key, wire_id) tuples of the keys in data. Tuples compare much
+        # faster than KeyWirePairs, and they sort in the same order.
+        self.sort_keys = []
+
+    def add(self, key):
+        """Inserts a key in the range index."""
+        if key is None:
+            raise ValueError('Cannot insert nil in the index')
+        sort_key = (key.key, key.wire_id)
+        position = bisect.bisect_right(self.sort_keys, sort_key)
+        self.sort_keys.insert(position, sort_key)
+        self.data.insert(position, key)
+
+    def remove(self, key):
+        """Removes a key from the range index."""
+        sort_key = (key.key, key.wire_id)
+        position = bisect.bisect_left(self.sort_keys, sort_key)
+        if (position == len(self.sort_keys) or
+                self.sort_keys[position] != sort_key):
+            raise ValueError('Key not in the index')
+        del self.sort_keys[position]
+        del self.data[position]
+
+    def list(self, first_key, last_key):
+        """List of values for the keys that fall within [first_key, last_key]."""
+        first, last = self._positions(first_key, last_key)
+        return self.data[first:last]
+
+    def count(self, first_key, last_key):
+        """Number of keys that fall within [first_key, last_key]."""
+        first, last = self._positions(first_key, last_key)
+        return max(0, last - first)
+
+    def _positions(self, first_key, last_key):
+        """The slice of data holding the keys within [first_key, last_key]."""
+        return (bisect.bisect_left(self.sort_keys,
+                                   (first_key.key, first_key.wire_id)),
+                bisect.bisect_right(self.sort_keys,
+                                    (last_key.key, last_key.wire_id)))
+
+
 class TracedRangeIndex(RangeIndex):
     """Augments RangeIndex to build a trace for the visualizer."""
 
@@ -256,16 +314,91 @@ class TracedAVLRangeIndex(AVLRangeIndex):
         return result
 
 
+class TracedSortedArrayRangeIndex(SortedArrayRangeIndex):
+    """Augments SortedArrayRangeIndex to build a trace for the visualizer."""
+
+    def __init__(self, trace):
+        """Sets the object receiving tracing info."""
+        SortedArrayRangeIndex.__init__(self)
+        self.trace = trace
+
+    def add(self, key):
+        self.trace.append({'type': 'add', 'id': key.wire.name})
+        SortedArrayRangeIndex.add(self, key)
+
+    def remove(self, key):
+        self.trace.append({'type': 'delete', 'id': key.wire.name})
+        SortedArrayRangeIndex.remove(self, key)
+
+    def list(self, first_key, last_key):
+        result = SortedArrayRangeIndex.list(self, first_key, last_key)
+        self.trace.append({'type': 'list', 'from': first_key.key,
+                           'to': last_key.key,
+                           'ids': [key.wire.name for key in result]})
+        return result
+
+    def count(self, first_key, last_key):
+        result = SortedArrayRangeIndex.count(self, first_key, last_key)
+        self.trace.append({'type': 'list', 'from': first_key.key,
+                           'to': last_key.key, 'count': result})
+        return result
+
+
+class FenwickTree(object):
+    """Fenwick (binary indexed) tree of counters at positions 1 to size.
+  
+  Changing a counter and summing the counters up to a position both take
+  O(log size) steps, each a few integer operations on a list."""
+
+    def __init__(self, size):
+        """Creates a tree whose counters are all 0."""
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, position, delta):
+        """Adds delta to the counter at a position."""
+        tree = self.tree
+        size = self.size
+        while position <= size:
+            tree[position] += delta
+            position += position & -position
+
+    def prefix_sum(self, position):
+        """Sum of the counters at positions 1 to position."""
+        tree = self.tree
+        result = 0
+        while position > 0:
+            result += tree[position]
+            position &= position - 1
+        return result
+
+
 class ResultSet(object):
     """Records the result of the circuit verifier (pairs of crossing wires)."""
 
     def __init__(self):
         """Creates an empty result set."""
         self.crossings = []
+        # The file that crossings are written to as they are added, or None
+        # if they are recorded in crossings.
+        self.stream = None
 
     def add_crossing(self, wire1, wire2):
         """Records the fact that two wires are crossing."""
-        self.crossings.append(sorted([wire1.name, wire2.name]))
+        crossing = sorted([wire1.name, wire2.name])
+        if self.stream is None:
+            self.crossings.append(crossing)
+        else:
+            self.stream.write(' '.join(crossing))
+            self.stream.write('\n')
+
+    def stream_to(self, file):
+        """Writes the crossings added from now on to a file.
+    
+    The crossings are written in the same format as write_to_file, and are not
+    recorded in crossings, so the memory used does not grow with the number of
+    crossings."""
+        self.stream = file
 
     def write_to_file(self, file):
         """Write the result to a file."""
@@ -364,54 +497,120 @@ class KeyWirePairH(KeyWirePair):
 class CrossVerifier(object):
     """Checks whether a wire network has any crossing wires."""
 
-    def __init__(self, layer):
+    # The range index implementations that a verifier can use, by name.
+    INDEX_TYPES = {'array': RangeIndex, 'avl': AVLRangeIndex,
+                   'sorted': SortedArrayRangeIndex}
+
+    # The ways count_crossings can count: 'index' sweeps with the range index,
+    # like wire_crossings, 'fenwick' sweeps with a FenwickTree over the
+    # horizontal wires' Y coordinates, and 'numpy' counts offline with
+    # vectorized sorts and searches. 'numpy' falls back to 'fenwick' when NumPy
+    # is not installed.
+    COUNT_METHODS = ['index', 'fenwick', 'numpy']
+
+    # Sweep line event types. Events at the same X coordinate are processed in
+    # this order, so wires that touch at their endpoints are crossing.
+    ADD = 0
+    QUERY = 1
+    REMOVE = 2
+
+    def __init__(self, layer, index='avl', count_method='numpy'):
         """Verifier for a layer of wires.
     
     Once created, the verifier can list the crossings between wires (the 
-    wire_crossings method) or count the crossings (count_crossings)."""
-
-        self.events = []
-
-        # Generate an array containing all the points of interest,
+    wire_crossings method) or count the crossings (count_crossings).
+    
+    Args:
+      layer: the WireLayer to be verified
+      index: the name of the range index implementation, one of the keys in
+          INDEX_TYPES
+      count_method: the way count_crossings counts, one of COUNT_METHODS"""
+
+        if index not in self.INDEX_TYPES:
+            raise ValueError('Unknown range index ' + index)
+        if count_method not in self.COUNT_METHODS:
+            raise ValueError('Unknown count method ' + count_method)
+        self.count_method = count_method
+
+        # Generate arrays containing all the points of interest, sorted
+        # according to their position along the horizontal axis (x coordinate).
         self._events_from_layer(layer)
 
-        # and then sort them according to their position along the horizontal axis (x coordinate).
-        self.events.sort()
-
-        self.index = AVLRangeIndex()
-        # self.index = RangeIndex()
+        self.index = self._build_index(index)
         self.result_set = ResultSet()
         self.performed = False
 
+    def _build_index(self, index):
+        """The range index named index, for the sweep line."""
+        return self.INDEX_TYPES[index]()
+
     def count_crossings(self):
         """Returns the number of pairs of wires that cross each other."""
         if self.performed:
             raise
         self.performed = True
+        if self.count_method == 'numpy' and numpy is not None:
+            return self._count_crossings_numpy()
+        if self.count_method != 'index':
+            return self._count_crossings_fenwick()
         return self._compute_crossings(True)
 
-    def wire_crossings(self):
-        """An array of pairs of wires that cross each other."""
+    def wire_crossings(self, file=None):
+        """An array of pairs of wires that cross each other.
+    
+    Args:
+      file: if given, the pairs are written to this file as the sweep line
+          finds them, instead of being kept in the returned ResultSet"""
         if self.performed:
             raise
         self.performed = True
+        if file is not None:
+            self.result_set.stream_to(file)
         return self._compute_crossings(False)
 
     def _events_from_layer(self, layer):
-        """Populates the sweep line events from the wire layer."""
+        """Populates the sweep line events from the wire layer.
+    
+    Event i happens at X coordinate event_x[i], has type event_types[i] (ADD,
+    QUERY or REMOVE), and is about the wire wires[event_wires[i]]. The events
+    are sorted by X coordinate, then type, then wire creation order."""
+        self.wires = sorted(layer.wires.values(),
+                            key=lambda wire: wire.object_id)
+        event_x = array.array('d')
+        event_types = array.array('b')
+        event_wires = array.array('l')
 
         # The x coordinates of points of interest are:
         # 1. the x coordinates of the left endpoints of horizontal wires
         # 2. the x coordinates of the right endpoints of horizontal wires
         # 3. the x coordinates of vertical wires
-        # left_edge = min([wire.x1 for wire in layer.wires.values()])
-        for wire in layer.wires.values():
+        for i in xrange(len(self.wires)):
+            wire = self.wires[i]
             if wire.is_horizontal():
-                self.events.append([wire.x1, 0, wire.object_id, 'add', wire])   # 1
-                self.events.append([wire.x2, 2, wire.object_id, 'remove', wire])    # 2
-                # self.events.append([left_edge, 0, wire.object_id, 'add', wire])
+                event_x.append(wire.x1)  # 1
+                event_types.append(self.ADD)
+                event_wires.append(i)
+                event_x.append(wire.x2)  # 2
+                event_types.append(self.REMOVE)
+                event_wires.append(i)
             else:
-                self.events.append([wire.x1, 1, wire.object_id, 'query', wire])  # 3
+                event_x.append(wire.x1)  # 3
+                event_types.append(self.QUERY)
+                event_wires.append(i)
+
+        columns = [event_x, event_types, event_wires]
+        if numpy is not None:
+            order = numpy.lexsort([_numpy_array(column)
+                                   for column in reversed(columns)])
+            columns = [array.array(column.typecode, numpy.take(
+                _numpy_array(column), order).tobytes()) for column in columns]
+        else:
+            order = sorted(xrange(len(event_x)), key=lambda i: (
+                event_x[i], event_types[i], event_wires[i]))
+            columns = [array.array(column.typecode,
+                                   map(column.__getitem__, order))
+                       for column in columns]
+        self.event_x, self.event_types, self.event_wires = columns
 
     def _compute_crossings(self, count_only):
         """Implements count_crossings and wire_crossings."""
@@ -420,19 +619,23 @@ class CrossVerifier(object):
         else:
             result = self.result_set
 
+        wires, event_types, event_wires = (self.wires, self.event_types,
+                                           self.event_wires)
+        ADD, QUERY, REMOVE = self.ADD, self.QUERY, self.REMOVE
+
         # sweeps a vertical line left to right over the plane containing the input data,
         # and performs operations when the line "hits" point of interest in the input.
-        for event in self.events:
-            event_x, event_type, wire = event[0], event[3], event[4]
+        for i in xrange(len(event_types)):
+            event_type, wire = event_types[i], wires[event_wires[i]]
 
             # When the sweep line hits the x coordinate of the left endpoint of a horizontal wire,
             # the wire is added to the range index
-            if event_type == 'add':
+            if event_type == ADD:
                 self.index.add(KeyWirePair(wire.y1, wire))
 
             # When the sweep line hits the x coordinate of a vertical wire, a range index query is performed
-            elif event_type == 'query':
-                self.trace_sweep_line(event_x)
+            elif event_type == QUERY:
+                self.trace_sweep_line(self.event_x[i])
                 if count_only:
                     result += self.index.count(KeyWirePairL(wire.y1), KeyWirePairH(wire.y2))
                     # result += len(cross_wires)
@@ -448,11 +651,70 @@ class CrossVerifier(object):
 
             # When the sweep line hits the x coordinate of the right endpoint of a horizontal wire,
             # the wire is removed from the range index
-            elif event_type == 'remove':
+            elif event_type == REMOVE:
                 self.index.remove(KeyWirePair(wire.y1, wire))
 
         return result
 
+    def _count_crossings_fenwick(self):
+        """Implements count_crossings with a Fenwick tree.
+    
+    The Y coordinates of the horizontal wires are numbered in sorted order,
+    and the tree counts the wires on the sweep line at each Y coordinate, so
+    no KeyWirePairs are created."""
+        wires, event_types, event_wires = (self.wires, self.event_types,
+                                           self.event_wires)
+        ADD, QUERY, REMOVE = self.ADD, self.QUERY, self.REMOVE
+        y_values = sorted(set([wire.y1 for wire in wires
+                               if wire.is_horizontal()]))
+        positions = dict([(y_values[i], i + 1) for i in xrange(len(y_values))])
+        counts = FenwickTree(len(y_values))
+
+        result = 0
+        for i in xrange(len(event_types)):
+            event_type, wire = event_types[i], wires[event_wires[i]]
+            if event_type == ADD:
+                counts.add(positions[wire.y1], 1)
+            elif event_type == QUERY:
+                self.trace_sweep_line(self.event_x[i])
+                result += (
+                    counts.prefix_sum(bisect.bisect_right(y_values, wire.y2)) -
+                    counts.prefix_sum(bisect.bisect_left(y_values, wire.y1)))
+            elif event_type == REMOVE:
+                counts.add(positions[wire.y1], -1)
+        return result
+
+    def _count_crossings_numpy(self):
+        """Implements count_crossings with NumPy array operations.
+    
+    A query crosses the wires added before it in the sorted events, minus
+    the wires removed before it, whose Y coordinates are within its range.
+    Both are counted for all queries at once by _numpy_dominance_count. The
+    sweep line is not traced."""
+        event_types = _numpy_array(self.event_types)
+        event_wires = _numpy_array(self.event_wires)
+        low = numpy.array([wire.y1 for wire in self.wires],
+                          dtype=numpy.float64)[event_wires]
+        high = numpy.array([wire.y2 for wire in self.wires],
+                           dtype=numpy.float64)[event_wires]
+
+        # Number the horizontal wires' Y coordinates, and turn each query's
+        # Y range into a range of numbers [low, high).
+        y_values = numpy.unique(low[event_types != self.QUERY])
+        positions = numpy.arange(len(event_types), dtype=numpy.int64)
+        queries = event_types == self.QUERY
+        query_low = numpy.searchsorted(y_values, low[queries], 'left')
+        query_high = numpy.searchsorted(y_values, high[queries], 'right')
+
+        result = 0
+        for update_type, sign in [(self.ADD, 1), (self.REMOVE, -1)]:
+            updates = event_types == update_type
+            result += sign * _numpy_dominance_count(
+                positions[updates],
+                numpy.searchsorted(y_values, low[updates]),
+                positions[queries], query_low, query_high, len(y_values))
+        return result
+
     def trace_sweep_line(self, x):
         """When tracing is enabled, adds info about where the sweep line is.
     
@@ -463,16 +725,52 @@ class CrossVerifier(object):
         pass
 
 
+def _numpy_array(values):
+    # A NumPy array sharing its memory with an array.array.
+    return numpy.frombuffer(values, dtype=values.typecode)
+
+
+def _numpy_dominance_count(point_x, point_y, query_x, query_low, query_high,
+                           y_count):
+    # The sum over all queries of the number of points with point_x < query_x
+    # and query_low <= point_y < query_high. All the arguments are
+    # non-negative integer NumPy arrays, and the Y values are below y_count.
+    #
+    # The points with X below query_x are split by the bits set in query_x:
+    # for bit b, they are the points whose X shifted right by b equals
+    # query_x shifted right by b, minus 1. Sorting the points by that group
+    # and then by Y makes each group's Y range a slice found by searchsorted.
+    # Only the sum is needed, so the range ends are sorted as well, which
+    # keeps searchsorted's memory accesses close together.
+    if len(point_x) == 0 or len(query_x) == 0:
+        return 0
+    span = y_count + 1
+    result = 0
+    for bit in xrange(int(max(point_x.max(), query_x.max())).bit_length()):
+        keys = numpy.sort((point_x >> bit) * span + point_y)
+        selected = numpy.nonzero((query_x >> bit) & 1)[0]
+        base = ((query_x[selected] >> bit) - 1) * span
+        high = numpy.sort(base + query_high[selected])
+        low = numpy.sort(base + query_low[selected])
+        result += int(numpy.searchsorted(keys, high, 'left').sum() -
+                      numpy.searchsorted(keys, low, 'left').sum())
+    return result
+
+
 class TracedCrossVerifier(CrossVerifier):
     """Augments CrossVerifier to build a trace for the visualizer."""
 
-    def __init__(self, layer):
-        CrossVerifier.__init__(self, layer)
+    INDEX_TYPES = {'array': TracedRangeIndex, 'avl': TracedAVLRangeIndex,
+                   'sorted': TracedSortedArrayRangeIndex}
+
+    def __init__(self, layer, index='avl', count_method='index'):
         self.trace = []
-        self.index = TracedAVLRangeIndex(self.trace)
-        # self.index = TracedRangeIndex(self.trace)
+        CrossVerifier.__init__(self, layer, index, count_method)
         self.result_set = TracedResultSet(self.trace)
 
+    def _build_index(self, index):
+        return self.INDEX_TYPES[index](self.trace)
+
     def trace_sweep_line(self, x):
         self.trace.append({'type': 'sweep', 'x': x})
 
@@ -486,16 +784,20 @@ if __name__ == '__main__':
     import sys
 
     layer = WireLayer.from_file(sys.stdin)
-    verifier = CrossVerifier(layer)
+    # INDEX selects the range index implementation (see INDEX_TYPES).
+    index = os.environ.get('INDEX', 'avl')
+    # COUNT_METHOD selects the way crossings are counted (see COUNT_METHODS).
+    verifier = CrossVerifier(layer, index,
+                             os.environ.get('COUNT_METHOD', 'numpy'))
 
     if os.environ.get('TRACE') == 'jsonp':
-        verifier = TracedCrossVerifier(layer)
+        verifier = TracedCrossVerifier(layer, index)
         result = verifier.wire_crossings()
         json_obj = {'layer': layer.as_json(), 'trace': verifier.trace_as_json()}
         sys.stdout.write('onJsonp(')
         json.dump(json_obj, sys.stdout)
         sys.stdout.write(');\n')
     elif os.environ.get('TRACE') == 'list':
-        verifier.wire_crossings().write_to_file(sys.stdout)
+        verifier.wire_crossings(sys.stdout)
     else:
         sys.stdout.write(str(verifier.count_crossings()) + "\n")
@@ -4,6 +4,10 @@ import unittest
 import sys
 import glob
 import re
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 from circuit2 import *
 
 
@@ -65,5 +69,95 @@ class Circuit2Test(unittest.TestCase):
                     self.assertTrue(same)
 
 
+    def testSortedArrayRangeIndex(self):
+        layer = WireLayer()
+        for i in range(6):
+            layer.add_wire('h' + str(i), 0, i % 3, 10, i % 3)
+        index = SortedArrayRangeIndex()
+        keys = [KeyWirePair(wire.y1, wire) for wire in layer.wires.values()]
+        for key in keys:
+            index.add(key)
+        self.assertEqual(4, index.count(KeyWirePairL(1), KeyWirePairH(2)))
+        self.assertEqual(sorted(index.list(KeyWirePairL(1), KeyWirePairH(2))),
+                         index.list(KeyWirePairL(1), KeyWirePairH(2)))
+        self.assertEqual(0, index.count(KeyWirePairL(2.5), KeyWirePairH(9)))
+        removed = [key for key in keys if key.key == 1]
+        for key in removed:
+            index.remove(key)
+        self.assertEqual(2, index.count(KeyWirePairL(1), KeyWirePairH(2)))
+        self.assertRaises(ValueError, index.remove, removed[0])
+
+    def testRangeIndexesAgree(self):
+        for in_filename in self._in_files:
+            if in_filename.find('grid') >= 0 or in_filename.find('10000') >= 0:
+                continue  # Large inputs are covered by testCorrectness.
+            crossings = []
+            for index in ['array', 'avl', 'sorted']:
+                with open(in_filename) as in_file:
+                    verifier = CrossVerifier(WireLayer.from_file(in_file),
+                                             index)
+                crossings.append(sorted(verifier.wire_crossings().crossings))
+            self.assertEqual(crossings[0], crossings[1])
+            self.assertEqual(crossings[0], crossings[2])
+
+    def testFenwickCount(self):
+        tree = FenwickTree(5)
+        for position in [1, 3, 3, 5]:
+            tree.add(position, 1)
+        tree.add(3, -1)
+        self.assertEqual([0, 1, 1, 2, 2, 3],
+                         [tree.prefix_sum(i) for i in range(6)])
+
+        for in_filename in self._in_files:
+            if in_filename.find('grid') >= 0 or in_filename.find('10000') >= 0:
+                continue  # Large inputs are covered by testCorrectness.
+            counts = []
+            for count_method in ['index', 'fenwick', 'numpy']:
+                with open(in_filename) as in_file:
+                    verifier = CrossVerifier(WireLayer.from_file(in_file),
+                                             'avl', count_method)
+                counts.append(verifier.count_crossings())
+            self.assertEqual(counts[0], counts[1])
+            self.assertEqual(counts[0], counts[2])
+        self.assertRaises(ValueError, CrossVerifier, WireLayer(), 'avl',
+                          'unknown')
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def testNumpyCount(self):
+        layer = WireLayer()
+        layer.add_wire('h1', 0, 0.5, 10, 0.5)
+        layer.add_wire('h2', 0.25, 2.75, 4.5, 2.75)
+        layer.add_wire('h3', 5.5, 0.5, 8, 0.5)
+        layer.add_wire('v1', 1.5, 0.1, 1.5, 0.4)  # Below h1.
+        layer.add_wire('v2', 2.5, 0.5, 2.5, 2.75)  # Touches h1 and h2.
+        layer.add_wire('v3', 4.5, 0.25, 4.5, 3)  # At h2's right end.
+        layer.add_wire('v4', 5.25, 0, 5.25, 1)  # Between h2 and h3.
+        layer.add_wire('v5', 7.75, 0.5, 7.75, 0.625)  # Touches h1 and h3.
+        for count_method in ['index', 'fenwick', 'numpy']:
+            verifier = CrossVerifier(layer, 'avl', count_method)
+            self.assertEqual(7, verifier.count_crossings())
+
+        for in_filename in self._in_files:
+            if in_filename.find('grid') >= 0:
+                continue  # Large inputs are covered by testCorrectness.
+            with open(in_filename) as in_file:
+                layer = WireLayer.from_file(in_file)
+            self.assertEqual(
+                CrossVerifier(layer, 'avl', 'fenwick').count_crossings(),
+                CrossVerifier(layer, 'avl', 'numpy').count_crossings())
+
+    def testStreamedCrossings(self):
+        for in_filename in self._in_files:
+            if in_filename.find('grid') >= 0 or in_filename.find('10000') >= 0:
+                continue  # Large inputs are covered by testCorrectness.
+            with open(in_filename) as in_file:
+                layer = WireLayer.from_file(in_file)
+            expected = StringIO()
+            CrossVerifier(layer).wire_crossings().write_to_file(expected)
+            streamed = StringIO()
+            result = CrossVerifier(layer).wire_crossings(streamed)
+            self.assertEqual([], result.crossings)
+            self.assertEqual(expected.getvalue(), streamed.getvalue())
+
 if __name__ == '__main__':
     unittest.main()